@@ -9,12 +9,13 @@
 """
 from PyQt5.QtWidgets import QMainWindow, QFrame, QGridLayout, QVBoxLayout, QHBoxLayout, \
     QApplication, QWidget, QSlider, QToolButton, QComboBox, QPushButton, QLineEdit, QLabel, \
-    QCheckBox, QDoubleSpinBox, QListWidget, QFileDialog, QGroupBox, QDial, QSpinBox
+    QCheckBox, QDoubleSpinBox, QListWidget, QFileDialog, QGroupBox, QDial, QSpinBox, QGraphicsItem
 from PyQt5 import uic, QtGui, QtCore
 
 from PIL import Image, ImageDraw
-from PIL.ImageQt import ImageQt
 
+import numpy as np
+from PyQt5 import sip
 from enum import Enum
 from pkgutil import get_data
 
@@ -22,6 +23,73 @@ from pkgutil import get_data
 from rctobject import palette as pal
 
 
+# Images for the views are handed to Qt as QImage over the RGBA buffer itself. A PIL image is
+# converted to its raw bytes once, numpy arrays are used without any copy. The QImage does not
+# own the buffer, callers keep the buffer until Qt has copied or drawn the image.
+
+def _qImageView(image):
+    """Wraps a PIL image or an uint8 array of shape (height, width, 4) as RGBA QImage. Returns
+    the QImage and the buffer it points to."""
+    if isinstance(image, Image.Image):
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+        buffer = np.asarray(image)
+    else:
+        buffer = image
+        if buffer.dtype != np.uint8 or buffer.strides[1:] != (4, 1):
+            buffer = np.ascontiguousarray(buffer, dtype=np.uint8)
+
+    height, width = buffer.shape[:2]
+    qimage = QtGui.QImage(sip.voidptr(buffer.ctypes.data), width, height,
+                          buffer.strides[0], QtGui.QImage.Format_RGBA8888)
+
+    return qimage, buffer
+
+
+def toQPixmap(image):
+    """Gives a QPixmap of a PIL image or an uint8 RGBA array."""
+    qimage, buffer = _qImageView(image)
+
+    return QtGui.QPixmap.fromImage(qimage)
+
+
+def updatePixmap(pixmap: QtGui.QPixmap, image, rect: tuple):
+    """Overwrites the region rect = (left, top, right, bottom) of pixmap with the same
+    region of image, which is a PIL image or an uint8 RGBA array of the pixmap's size."""
+    left, top, right, bottom = rect
+    if isinstance(image, Image.Image):
+        region, buffer = _qImageView(image.crop(rect))
+    else:
+        region, buffer = _qImageView(image[top:bottom, left:right])
+
+    painter = QtGui.QPainter(pixmap)
+    painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+    painter.drawImage(left, top, region)
+    painter.end()
+
+
+class PixmapCanvasItem(QGraphicsItem):
+    """Graphics item showing a pixmap that is painted on in place. Unlike QGraphicsPixmapItem it
+    holds the only reference to its pixmap, so painting a region does not copy the whole pixmap."""
+
+    def __init__(self, image, parent=None):
+        super().__init__(parent)
+        self.canvas = toQPixmap(image)
+
+    def boundingRect(self):
+        return QtCore.QRectF(self.canvas.rect())
+
+    def paint(self, painter, option, widget=None):
+        painter.drawPixmap(0, 0, self.canvas)
+
+    def updateRegion(self, image, rect: tuple):
+        """Redraws the region rect = (left, top, right, bottom) from image, see updatePixmap."""
+        updatePixmap(self.canvas, image, rect)
+
+        left, top, right, bottom = rect
+        self.update(QtCore.QRectF(left, top, right - left, bottom - top))
+
+
 class ToolCursors(QtGui.QCursor):
     def __init__(self, toolbox, zoom_factor, color=[0, 0, 0]):
         tool = toolbox.giveTool()
@@ -42,9 +110,7 @@ class ToolCursors(QtGui.QCursor):
             draw.line([(0, 0), (size_x-1, 0), (size_x-1, size_y-1), (0, size_y-1), (0, 0)],
                       fill=(color[0], color[1], color[2], 255), width=1)
 
-            im_qt = ImageQt(im)
-
-            super().__init__(QtGui.QPixmap.fromImage(im_qt), hotX=1, hotY=1)
+            super().__init__(toQPixmap(im), hotX=1, hotY=1)
 
 
 class ToolBoxWidget(QWidget):
@@ -322,9 +388,11 @@ class ShadeButton(QPushButton):
         self.setCheckable(True)
         self.shade = shade
 
+        # shades present in the sprite are marked with a dot in the border color
         self.setStyleSheet("QPushButton"
                            "{"
                            f"background-color :  rgb{shade};"
+                           f"color : rgb{border_shade};"
                            "}"
                            "QPushButton:pressed"
                            "{"
@@ -337,6 +405,10 @@ class ShadeButton(QPushButton):
                            "}"
                            )
 
+    def setPixelCount(self, pixel_count: int):
+        self.setText('•' if pixel_count else '')
+        self.setToolTip(f'{pixel_count} px' if pixel_count else '')
+
 
 class ColorSelectWidget(QWidget):
     def __init__(self, palette, first_remap: bool = False, second_remap: bool = False, third_remap: bool = False):
@@ -443,6 +515,14 @@ class ColorSelectWidget(QWidget):
 
         return ret
 
+    def setPresentColors(self, colors: dict):
+        """Marks the shades present in a sprite, colors as given by Sprite.colorsPresent."""
+        for name, bar in self.bars.items():
+            pixel_counts = colors.get(name)
+            for i, button in enumerate(bar.buttons):
+                button.setPixelCount(
+                    int(pixel_counts[i]) if pixel_counts is not None else 0)
+
     def giveActiveShade(self):
         if self.active_color_button:
             return self.active_color_button.shade
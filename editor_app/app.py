@@ -11,7 +11,7 @@
 
 from PyQt5.QtWidgets import QMainWindow, QDialog, QApplication, QMessageBox, QWidget, QStyle, QProxyStyle, QGridLayout, \
     QVBoxLayout, QHBoxLayout, QTabWidget, QDial, QSlider, QScrollBar, QGroupBox, QToolButton, QComboBox, \
-    QPushButton, QLineEdit, QLabel, QCheckBox, QDoubleSpinBox, QListWidget, QFileDialog, QInputDialog
+    QPushButton, QLineEdit, QLabel, QCheckBox, QDoubleSpinBox, QListWidget, QFileDialog, QInputDialog, QProgressBar
 from PyQt5 import uic, QtGui, QtCore, QtNetwork
 from PIL import Image
 from PIL.ImageQt import ImageQt
@@ -43,6 +43,7 @@ import auxiliaries as aux
 from rctobject import constants as cts
 from rctobject import objects as obj
 from rctobject import palette as pal
+from rctobject import objectindex as oidx
 
 # import pyi_splash
 
@@ -73,9 +74,29 @@ class MainWindowUi(QMainWindow):
         self.setFocusPolicy(QtCore.Qt.NoFocus)
 
         self.app_data_path = app_data_path
+        self.object_index = None
+        # the index of the object folder is rescanned in the background whenever it is opened
+        self.index_updater = aux.IndexUpdater()
         self.loadSettings()
         self.bounding_boxes = aux.BoundingBoxes()
         self.symm_axes = aux.SymmetryAxes()
+        self.redraw_scheduler = aux.RedrawScheduler()
+
+        # Objects are loaded in the background, the tabs are added as the loads finish
+        self.object_loader = aux.ObjectLoader()
+        self.object_loader.objectLoaded.connect(self.objectLoaded)
+        self.object_loader.loadFailed.connect(self.objectLoadFailed)
+        self.object_loader.progressChanged.connect(self.loadProgressChanged)
+
+        self.load_progress_bar = QProgressBar()
+        self.load_progress_bar.setMaximumWidth(200)
+        self.load_progress_bar.setFormat('Loading %v/%m')
+        self.load_cancel_button = QToolButton()
+        self.load_cancel_button.setText('Cancel')
+        self.load_cancel_button.clicked.connect(self.object_loader.cancel)
+        self.statusBar().addPermanentWidget(self.load_progress_bar)
+        self.statusBar().addPermanentWidget(self.load_cancel_button)
+        self.loadProgressChanged(0, 0)
 
         self.setAcceptDrops(True)
 
@@ -242,6 +263,17 @@ class MainWindowUi(QMainWindow):
 
     # Internal methods
 
+    def giveObjectIndex(self):
+        if not self.object_index or self.object_index.folder != os.path.abspath(f'{self.openpath}/object'):
+            if self.object_index:
+                self.object_index.close()
+            self.object_index = oidx.ObjectIndex(
+                f'{self.openpath}/object', f'{self.app_data_path}/object_index.sqlite')
+            self.index_updater.update(
+                self.object_index.folder, self.object_index.index_path)
+
+        return self.object_index
+
     def loadSettings(self):
         try:
             path = self.app_data_path
@@ -270,6 +302,7 @@ class MainWindowUi(QMainWindow):
                 self.settings['background_color_custom'] = (0, 0, 0)
                 self.settings['palette'] = 0
                 self.settings['history_maximum'] = 5
+                self.settings['history_memory'] = 32
 
                 self.settings['small_scenery_defaults'] = {}
 
@@ -340,9 +373,13 @@ class MainWindowUi(QMainWindow):
         if update_widgets:
             self.tool_widget.color_select_panel.switchPaletteFirstRemap(
                 self.current_palette)
-            for index in range(self.object_tabs.count()):
-                tab = self.object_tabs.widget(index)
-                tab.o.switchPalette(self.current_palette)
+            object_tabs = [self.object_tabs.widget(index)
+                           for index in range(self.object_tabs.count())]
+            obj.switchPalettes(
+                [tab.o for tab in object_tabs], self.current_palette)
+            for tab in object_tabs:
+                # switching rebuilt the images as RGBA
+                tab.o.compactSprites(obj.COMPACT_MIN_SPRITES)
                 tab.sprites_tab.updateAllViews()
 
             for index in range(self.sprite_tabs.count()):
@@ -387,23 +424,30 @@ class MainWindowUi(QMainWindow):
                                           "}")
 
     def loadObjectFromPath(self, filepath):
-        try:
-            o = obj.load(filepath, openpath=self.openpath)
-            name = o.data.get('id', '').split('.', 2)[-1]
-            if not name:
-                if o.old_id:
-                    name = o.old_id
-                else:
-                    name = f'Object {self.new_object_count}'
-                    self.new_object_count += 1
-        except Exception as e:
-            msg = QMessageBox(self)
-            msg.setIcon(QMessageBox.Critical)
-            msg.setWindowTitle("Error Trapper")
-            msg.setText("Failed to load object")
-            msg.setInformativeText(str(traceback.format_exc()))
-            msg.show()
-            return
+        self.object_loader.load(filepath, self.openpath, self.current_palette)
+
+    def loadProgressChanged(self, done, total):
+        self.load_progress_bar.setRange(0, total)
+        self.load_progress_bar.setValue(done)
+        self.load_progress_bar.setVisible(total > 0)
+        self.load_cancel_button.setVisible(total > 0)
+
+    def objectLoadFailed(self, filepath, error):
+        msg = QMessageBox(self)
+        msg.setIcon(QMessageBox.Critical)
+        msg.setWindowTitle("Error Trapper")
+        msg.setText("Failed to load object")
+        msg.setInformativeText(error)
+        msg.show()
+
+    def objectLoaded(self, filepath, o):
+        name = o.data.get('id', '').split('.', 2)[-1]
+        if not name:
+            if o.old_id:
+                name = o.old_id
+            else:
+                name = f'Object {self.new_object_count}'
+                self.new_object_count += 1
 
         extension = splitext(filepath)[1].lower()
         author_id = None
@@ -413,7 +457,8 @@ class MainWindowUi(QMainWindow):
             if len(filename.split('.')) > 2:
                 author_id = filename.split('.')[0]
 
-        if not self.current_palette == pal.orct:
+        # the palette may have been changed while the object was loading
+        if not o.palette == self.current_palette:
             o.switchPalette(self.current_palette)
 
         object_tab = wdg.ObjectTab(o, self, filepath, author_id=author_id)
@@ -611,20 +656,29 @@ class MainWindowUi(QMainWindow):
         dat_id, ok = QInputDialog().getText(self, "DAT Identifier Import",
                                             "Input DAT Identifier of object to load.")
         if ok and dat_id:
+            index = self.giveObjectIndex()
             try:
-                o = obj.loadFromId(dat_id, openpath=self.openpath)
+                o = obj.loadFromId(dat_id, openpath=self.openpath,
+                                   index=index)
                 name = dat_id
             except Exception as e:
                 msg = QMessageBox(self)
                 msg.setIcon(QMessageBox.Critical)
                 msg.setWindowTitle("Error Trapper")
-                msg.setText("Failed to load object")
+                if self.index_updater.isUpdating(index.folder):
+                    msg.setText(
+                        "Failed to load object, the object folder is still being indexed")
+                else:
+                    msg.setText("Failed to load object")
+                    # objects may have been added to the folder since the last scan
+                    self.index_updater.update(index.folder, index.index_path)
                 msg.setInformativeText(str(traceback.format_exc()))
                 msg.show()
                 return
 
             if not self.current_palette == pal.orct:
                 o.switchPalette(self.current_palette)
+            o.compactSprites(obj.COMPACT_MIN_SPRITES)
 
             object_tab = wdg.ObjectTab(o, self, self.last_open_folder)
 
@@ -16,14 +16,17 @@ from PIL import Image
 from PIL.ImageQt import ImageQt
 import sys
 import io
+import traceback
 from os.path import abspath, join
 
 from pkgutil import get_data
+from PyQt5 import sip
 
 
 from rctobject import constants as cts
 from rctobject import objects as obj
 from rctobject import palette as pal
+from rctobject import objectindex as oidx
 
 
 def resource_path(relative_path):
@@ -210,3 +213,203 @@ class SymmetryAxes():
 
             elif shape == obj.SmallScenery.Shape.THREEQ or shape == obj.SmallScenery.Shape.FULLD:
                 return self.symm_diagonal[rot % 2]
+
+
+class RedrawScheduler(QtCore.QObject):
+    """Coalesces view updates and runs them paced by a frame timer. Every update is registered
+    with the widget it draws on and a name; requesting it again before the next frame replaces
+    the pending request, so each view is drawn at most once per frame. Low priority updates
+    (previews) wait while high priority ones keep coming, but at most LOW_PRIORITY_DELAY frames."""
+
+    HIGH = 0
+    LOW = 1
+
+    LOW_PRIORITY_DELAY = 6
+
+    def __init__(self, fps: int = 60):
+        super().__init__()
+
+        self.pending = {}
+        self.low_waiting = 0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.setInterval(int(1000/fps))
+        self.timer.timeout.connect(self.tick)
+
+    def request(self, target, name: str, callback, priority: int = HIGH):
+        # targets like QStandardItems are not hashable, they are told apart by identity
+        self.pending[(id(target), name)] = (target, priority, callback)
+
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def cancel(self, target):
+        for key in [key for key, request in self.pending.items() if request[0] is target]:
+            self.pending.pop(key)
+
+    def flush(self):
+        """Runs all pending updates now."""
+        self.run([self.HIGH, self.LOW])
+
+    def tick(self):
+        priorities = {priority for _, priority, _ in self.pending.values()}
+
+        if self.HIGH in priorities and self.LOW in priorities and \
+                self.low_waiting < self.LOW_PRIORITY_DELAY:
+            self.low_waiting += 1
+            self.run([self.HIGH])
+        else:
+            self.low_waiting = 0
+            self.run([self.HIGH, self.LOW])
+
+        if not self.pending:
+            self.timer.stop()
+
+    def run(self, priorities: list):
+        due = [(key, request) for key, request in self.pending.items()
+               if request[1] in priorities]
+
+        for key, request in due:
+            # requested again while an earlier callback ran, the new request runs on a later tick
+            if self.pending.get(key) is not request:
+                continue
+            self.pending.pop(key)
+
+            target, _, callback = request
+            if isinstance(target, sip.simplewrapper) and sip.isdeleted(target):
+                continue
+
+            callback()
+
+
+class IndexUpdater(QtCore.QObject):
+    """Rescans object indices on a worker thread and reports it by updateFinished with the folder
+    and the error, empty on success. The index is opened again on the worker, as a sqlite
+    connection may only be used by the thread that made it."""
+
+    updateFinished = QtCore.pyqtSignal(str, str)
+
+    def __init__(self):
+        super().__init__()
+
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.running = set()
+
+        self.updateFinished.connect(self.running.discard)
+
+    def update(self, folder: str, index_path: str):
+        if folder in self.running:
+            return
+
+        self.running.add(folder)
+        self.pool.start(IndexUpdater.Task(self, folder, index_path))
+
+    def isUpdating(self, folder: str):
+        return folder in self.running
+
+    class Task(QtCore.QRunnable):
+        def __init__(self, updater, folder, index_path):
+            super().__init__()
+            self.updater = updater
+            self.folder = folder
+            self.index_path = index_path
+
+        def run(self):
+            try:
+                with oidx.ObjectIndex(self.folder, self.index_path) as index:
+                    index.update()
+            except Exception:
+                self.updater.updateFinished.emit(
+                    self.folder, traceback.format_exc())
+                return
+
+            self.updater.updateFinished.emit(self.folder, '')
+
+
+class ObjectLoader(QtCore.QObject):
+    """Loads objects on a pool of worker threads. Every finished load is reported by objectLoaded
+    or loadFailed, the number of finished and requested loads by progressChanged. Cancelling drops
+    the loads that did not start yet and discards the results of the running ones."""
+
+    objectLoaded = QtCore.pyqtSignal(str, object)
+    loadFailed = QtCore.pyqtSignal(str, str)
+    progressChanged = QtCore.pyqtSignal(int, int)
+
+    # emitted from the worker threads, delivered in the thread of the loader
+    _finished = QtCore.pyqtSignal(int, str, object, str)
+
+    MAX_THREADS = 4
+
+    def __init__(self, max_threads: int = None):
+        super().__init__()
+
+        cores = QtCore.QThread.idealThreadCount()
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(
+            max_threads or min(cores, self.MAX_THREADS))
+        # each load decodes its sprites on threads of its own, together they stay within the cores
+        self.workers = max(1, cores // self.pool.maxThreadCount())
+
+        # loads requested before the last cancel belong to an older generation
+        self.generation = 0
+        self.total = 0
+        self.done = 0
+
+        self._finished.connect(self.loadFinished)
+
+    def load(self, filepath: str, openpath: str, palette=pal.orct):
+        """Loads the object at filepath and switches it to palette."""
+        self.total += 1
+        self.pool.start(ObjectLoader.Task(
+            self, self.generation, filepath, openpath, palette))
+        self.progressChanged.emit(self.done, self.total)
+
+    def cancel(self):
+        self.pool.clear()
+        self.generation += 1
+        self.total = 0
+        self.done = 0
+        self.progressChanged.emit(self.done, self.total)
+
+    def loadFinished(self, generation, filepath, o, error):
+        if generation != self.generation:
+            return
+
+        self.done += 1
+        if o is not None:
+            self.objectLoaded.emit(filepath, o)
+        else:
+            self.loadFailed.emit(filepath, error)
+
+        if self.done == self.total:
+            self.total = 0
+            self.done = 0
+        self.progressChanged.emit(self.done, self.total)
+
+    class Task(QtCore.QRunnable):
+        def __init__(self, loader, generation, filepath, openpath, palette):
+            super().__init__()
+            self.loader = loader
+            self.generation = generation
+            self.filepath = filepath
+            self.openpath = openpath
+            self.palette = palette
+
+        def run(self):
+            if self.generation != self.loader.generation:
+                return
+
+            try:
+                o = obj.load(self.filepath, openpath=self.openpath,
+                             workers=self.loader.workers)
+                if not self.palette == pal.orct:
+                    o.switchPalette(self.palette, self.loader.workers)
+                o.compactSprites(obj.COMPACT_MIN_SPRITES)
+            except Exception:
+                self.loader._finished.emit(
+                    self.generation, self.filepath, None, traceback.format_exc())
+                return
+
+            self.loader._finished.emit(self.generation, self.filepath, o, '')
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2024 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Undo/redo history of a sprite layer.
+
+A state of a sprite is its image with the offsets x, y. Both stacks keep only their top
+state complete, every other state is stored as the difference to the state above it:
+the bounding box of the pixels that changed with the old pixels, as palette indices where
+possible. Old states are dropped once the stored data exceeds the memory budget.
+"""
+
+import numpy as np
+from PIL import Image
+
+
+class SpriteState:
+    """Complete state of a sprite. The image is shared, images of sprites are never changed
+    in place but replaced."""
+
+    def __init__(self, image: Image.Image, x: int, y: int):
+        self.image = image
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def fromSprite(cls, sprite):
+        return cls(sprite.image, int(sprite.x), int(sprite.y))
+
+    def nbytes(self):
+        return self.image.width*self.image.height*4
+
+
+class SpriteDiff:
+    """Turns the state above in the stack back into the stored state."""
+
+    def __init__(self, state: SpriteState, state_above: SpriteState, palette):
+        self.x, self.y = state.x, state.y
+        self.width, self.height = state.image.size
+
+        # Compare both images on a frame covering both of them
+        frame = _unionRect([_rect(state), _rect(state_above)])
+        old = _onFrame(state.image, state.x, state.y, frame)
+        new = _onFrame(state_above.image, state_above.x, state_above.y, frame)
+
+        changed = (old != new).any(axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        cols = np.flatnonzero(changed.any(axis=0))
+
+        if len(rows) == 0:
+            self.region_x, self.region_y = frame[0], frame[1]
+            self.pixels = np.zeros((0, 0, 4), dtype=np.uint8)
+            self.palette = None
+            return
+
+        pixels = old[rows[0]:rows[-1]+1, cols[0]:cols[-1]+1]
+        self.region_x = frame[0] + int(cols[0])
+        self.region_y = frame[1] + int(rows[0])
+
+        indices = palette.toIndices(pixels)
+        transparent = pixels[:, :, 3] == 0
+        visible = ~transparent
+        if (indices[visible] == 255).any() or (pixels[:, :, 3][visible] != 255).any():
+            # keep colors that are not in the palette as they are
+            self.pixels = pixels
+            self.palette = None
+        else:
+            indices[transparent] = 255
+            self.pixels = indices
+            self.palette = palette
+
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    def apply(self, state_above: SpriteState):
+        region_height, region_width = self.pixels.shape[:2]
+        frame = _unionRect([(self.x, self.y, self.width, self.height), _rect(state_above),
+                            (self.region_x, self.region_y, region_width, region_height)])
+
+        data = _onFrame(state_above.image, state_above.x,
+                        state_above.y, frame)
+
+        if self.palette is not None:
+            colors = np.zeros((256, 4), dtype=np.uint8)
+            flat = self.palette.flatColors()
+            colors[:len(flat), :3] = flat
+            colors[:len(flat), 3] = 255
+            pixels = colors[self.pixels]
+        else:
+            pixels = self.pixels
+
+        left, top = self.region_x - frame[0], self.region_y - frame[1]
+        data[top:top+region_height, left:left+region_width] = pixels
+
+        left, top = self.x - frame[0], self.y - frame[1]
+        image = Image.fromarray(
+            np.ascontiguousarray(data[top:top+self.height, left:left+self.width]), 'RGBA')
+
+        return SpriteState(image, self.x, self.y)
+
+
+class SpriteHistory:
+    """Undo and redo stacks of a sprite layer, limited by memory_budget in bytes and by
+    maximum number of undo steps."""
+
+    def __init__(self, memory_budget: int, maximum: int = None):
+        self.memory_budget = memory_budget
+        self.maximum = maximum
+
+        # each stack holds diffs with the complete top state at the end
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def __len__(self):
+        return len(self.undo_stack)
+
+    def canUndo(self):
+        return len(self.undo_stack) > 0
+
+    def canRedo(self):
+        return len(self.redo_stack) > 0
+
+    def nbytes(self):
+        return sum(entry.nbytes() for entry in self.undo_stack + self.redo_stack)
+
+    def add(self, sprite):
+        """Records the current state of the sprite before it gets changed."""
+        _push(self.undo_stack, SpriteState.fromSprite(sprite), sprite.palette)
+        self.redo_stack = []
+
+        self._limit()
+
+    def undo(self, sprite):
+        """Sets the sprite to the previous state, returns False if there is none."""
+        if not self.undo_stack:
+            return False
+
+        _push(self.redo_stack, SpriteState.fromSprite(sprite), sprite.palette)
+        _setState(sprite, _pop(self.undo_stack))
+
+        return True
+
+    def redo(self, sprite):
+        """Sets the sprite to the next state, returns False if there is none."""
+        if not self.redo_stack:
+            return False
+
+        _push(self.undo_stack, SpriteState.fromSprite(sprite), sprite.palette)
+        _setState(sprite, _pop(self.redo_stack))
+
+        return True
+
+    def _limit(self):
+        if self.maximum:
+            del self.undo_stack[:max(len(self.undo_stack)-self.maximum, 0)]
+
+        # always keep the last state so the latest change can be undone
+        nbytes = sum(entry.nbytes() for entry in self.undo_stack)
+        while len(self.undo_stack) > 1 and nbytes > self.memory_budget:
+            nbytes -= self.undo_stack.pop(0).nbytes()
+
+
+def _push(stack: list, state: SpriteState, palette):
+    if stack:
+        stack[-1] = SpriteDiff(stack[-1], state, palette)
+    stack.append(state)
+
+
+def _pop(stack: list):
+    state = stack.pop(-1)
+    if stack:
+        stack[-1] = stack[-1].apply(state)
+
+    return state
+
+
+def _setState(sprite, state: SpriteState):
+    sprite.image = state.image
+    sprite.x = state.x
+    sprite.y = state.y
+
+
+def _rect(state: SpriteState):
+    return (state.x, state.y, state.image.width, state.image.height)
+
+
+def _unionRect(rects: list):
+    x0 = min(rect[0] for rect in rects)
+    y0 = min(rect[1] for rect in rects)
+    x1 = max(rect[0]+rect[2] for rect in rects)
+    y1 = max(rect[1]+rect[3] for rect in rects)
+
+    return (x0, y0, x1-x0, y1-y0)
+
+
+def _onFrame(image: Image.Image, x: int, y: int, frame: tuple):
+    data = np.zeros((frame[3], frame[2], 4), dtype=np.uint8)
+    left, top = x - frame[0], y - frame[1]
+    data[top:top+image.height, left:left+image.width] = np.array(image.convert('RGBA'))
+
+    return data
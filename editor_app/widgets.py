@@ -12,8 +12,7 @@ from PyQt5.QtWidgets import QMainWindow, QDialog, QMenu, QGroupBox, QVBoxLayout,
     QScrollBar, QPushButton, QLineEdit, QLabel, QCheckBox, QSpinBox, QDoubleSpinBox, \
     QListWidget, QListWidgetItem, QFileDialog, QGraphicsView, QGraphicsScene, QGraphicsRectItem, QGraphicsPixmapItem
 from PyQt5 import uic, QtGui, QtCore, QtWidgets
-from PIL import Image, ImageGrab, ImageDraw
-from PIL.ImageQt import ImageQt
+from PIL import Image, ImageGrab, ImageDraw, ImageChops
 from copy import copy
 import io
 import os.path
@@ -24,6 +23,7 @@ from pkgutil import get_data
 
 
 import auxiliaries as aux
+from history import SpriteHistory
 
 from customwidgets import RemapColorSelectButton, ColorSelectWidget, ToolBoxWidget
 
@@ -36,6 +36,9 @@ from rctobject import objects as obj
 
 import widgetsSS
 
+# Side length of the squares in which the airbrush noise is generated
+AIRBRUSH_TILE = 32
+
 # Object Tab
 
 
@@ -95,17 +98,15 @@ class ObjectTab(QWidget):
             filepath = self.lastpath
 
         if self.settings_tab.checkBox_remapCheck.isChecked():
+            checks = {'hasPrimaryColour': spr.Sprite.checkPrimaryColor,
+                      'hasSecondaryColour': spr.Sprite.checkSecondaryColor,
+                      'hasTertiaryColour': spr.Sprite.checkTertiaryColor}
             for path, sprite in self.o.sprites.items():
-                if sprite.checkPrimaryColor():
-                    self.o['properties']['hasPrimaryColour'] = True
-                    break
-            for path, sprite in self.o.sprites.items():
-                if sprite.checkSecondaryColor():
-                    self.o['properties']['hasSecondaryColour'] = True
-                    break
-            for path, sprite in self.o.sprites.items():
-                if sprite.checkTertiaryColor():
-                    self.o['properties']['hasTertiaryColour'] = True
+                for flag, check in list(checks.items()):
+                    if check(sprite):
+                        self.o['properties'][flag] = True
+                        del checks[flag]
+                if not checks:
                     break
 
         if filepath:
@@ -124,7 +125,8 @@ class ObjectTab(QWidget):
         self.locked = True
         self.locked_sprite_tab = locked_sprite_tab
         self.locked_sprite_tab.layerUpdated.connect(
-            lambda: self.updateCurrentMainView(emit_signal=False))
+            lambda: self.main_window.redraw_scheduler.request(
+                self.sprites_tab, 'main_view', lambda: self.updateCurrentMainView(emit_signal=False)))
 
         self.sprites_tab.createLayers(
             locked_sprite_tab.base_x, locked_sprite_tab.base_y)
@@ -211,6 +213,7 @@ class SpriteTab(QWidget):
         self.view.setBackgroundBrush(QtCore.Qt.gray)
 
         self.lastpos = (0, 0)
+        self.stroke = None
 
         # Sprite zoom
         self.zoom_factor = 1
@@ -230,6 +233,8 @@ class SpriteTab(QWidget):
 
         self.protected_pixels = Image.new(
             '1', (self.canvas_width, self.canvas_height))
+        self.protected_pixels_key = None
+        self.airbrush_strength = None
 
         self.lastpath = filepath
         self.saved = False
@@ -359,6 +364,8 @@ class SpriteTab(QWidget):
 
         self.protected_pixels = Image.new(
             '1', (self.canvas_width, self.canvas_height))
+        self.protected_pixels_key = None
+        self.airbrush_strength = None
 
     def zoomChanged(self, val):
         self.view.scale(val/self.zoom_factor, val/self.zoom_factor)
@@ -374,10 +381,7 @@ class SpriteTab(QWidget):
 
         self.view.layer_boundingbox.setVisible(visible)
 
-        image = ImageQt(backbox)
-
-        pixmap = QtGui.QPixmap.fromImage(image)
-        self.view.layer_boundingbox.setPixmap(pixmap)
+        self.view.layer_boundingbox.setPixmap(cwdg.toQPixmap(backbox))
         self.view.layer_boundingbox.setOffset(
             coords[0]+self.base_x, coords[1]+self.base_y)
 
@@ -392,10 +396,7 @@ class SpriteTab(QWidget):
 
         self.view.layer_symm_axes.setVisible(visible)
 
-        image = ImageQt(symm_axes)
-
-        pixmap = QtGui.QPixmap.fromImage(image)
-        self.view.layer_symm_axes.setPixmap(pixmap)
+        self.view.layer_symm_axes.setPixmap(cwdg.toQPixmap(symm_axes))
         self.view.layer_symm_axes.setOffset(
             coords[0]+self.base_x, coords[1]+self.base_y)
 
@@ -450,23 +451,79 @@ class SpriteTab(QWidget):
 
         self.updateView()
 
-    def draw(self, x, y, shade):
+    # Painting works on a canvas sized working image that is kept during the whole stroke.
+    # Each mouse event only touches the region of the brush on it and on the stroke item, which
+    # shows the canvas in place of the layer; the sprite is cropped and updated once, when the
+    # stroke ends.
+
+    def beginStroke(self):
+        if self.stroke:
+            self.endStroke()
+
         layer = self.currentActiveLayer()
         sprite = layer.sprite
         canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
+
+        # a pending redraw would replace the canvas on the layer
+        self.main_window.redraw_scheduler.cancel(layer)
 
         coords = (self.base_x+sprite.x,
                   self.base_y+sprite.y)
 
         canvas.paste(sprite.image, coords, mask=sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
 
+        # the stroke item is a child of the layer item, so it keeps its visibility and order
+        item = cwdg.PixmapCanvasItem(canvas, layer.item)
+        item.setPos(layer.base_x - self.base_x, layer.base_y - self.base_y)
+        layer.item.setPixmap(QtGui.QPixmap())
+
+        self.stroke = {'layer': layer, 'canvas': canvas, 'item': item,
+                       'canvas_protect': canvas.copy(), 'canvas_working': None}
+
+    def endStroke(self):
+        if not self.stroke:
+            return
+
+        layer = self.stroke['layer']
+        canvas = self.stroke['canvas']
+        item = self.stroke['item']
+        if not sip.isdeleted(item) and item.scene():
+            item.scene().removeItem(item)
+        self.stroke = None
+
+        bbox = canvas.getbbox()
+
+        if bbox:
+            canvas = canvas.crop(bbox)
+            x_offset = -self.base_x + bbox[0]
+            y_offset = -self.base_y + bbox[1]
+        else:
+            x_offset = 0
+            y_offset = 0
+
+        layer.sprite.image = canvas
+        layer.setOffset(x_offset, y_offset)
+
+        # the offset changed already, the cropped image has to be shown with it right away
+        layer.updateLayer()
+        if layer is self.currentActiveLayer():
+            self.main_window.redraw_scheduler.cancel(layer)
+            self.layerUpdated.emit()
+
+    def updateStroke(self, rect):
+        """Redraws the region rect = (left, top, right, bottom) of the canvas on the layer."""
+        self.stroke['item'].updateRegion(self.stroke['canvas'], rect)
+
+    def drawBrush(self, draw, x, y, shade):
+        """Draws the brush at x, y and the line from the last position with shade.
+        Returns the region of the canvas that was drawn on, None if it is outside."""
         brushsize = self.main_window.giveBrushsize()
         brushshape = self.main_window.giveBrushshape()
 
-        draw = ImageDraw.Draw(canvas)
+        x0, y0 = self.lastpos
+        rect = (min(x, x0) - brushsize - 1, min(y, y0) - brushsize - 1,
+                max(x, x0) + 2*brushsize + 1, max(y, y0) + 2*brushsize + 1)
+
         if brushsize != 1:
             if brushshape == cwdg.BrushShapes.SQUARE:
                 draw.rectangle(
@@ -494,7 +551,6 @@ class SpriteTab(QWidget):
             draw.point((x, y), shade)
 
         if self.lastpos != (x, y):
-            x0, y0 = self.lastpos
             if brushsize % 2 == 0:
                 x_mod = -1 if y > y0 else 0
                 y_mod = -1 if x > x0 else 0
@@ -510,22 +566,25 @@ class SpriteTab(QWidget):
 
             self.lastpos = (x, y)
 
-        canvas.paste(canvas_protect, mask=self.protected_pixels)
+        rect = (max(rect[0], 0), max(rect[1], 0), min(
+            rect[2], self.canvas_width), min(rect[3], self.canvas_height))
 
-        bbox = canvas.getbbox()
+        return rect if rect[0] < rect[2] and rect[1] < rect[3] else None
 
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -self.base_x + bbox[0]
-            y_offset = -self.base_y + bbox[1]
-        else:
-            x_offset = 0
-            y_offset = 0
+    def draw(self, x, y, shade):
+        if not self.stroke:
+            self.beginStroke()
 
-        sprite.image = canvas
-        layer.setOffset(x_offset, y_offset)
+        canvas = self.stroke['canvas']
 
-        self.updateView()
+        rect = self.drawBrush(ImageDraw.Draw(canvas), x, y, shade)
+        if not rect:
+            return
+
+        canvas.paste(self.stroke['canvas_protect'].crop(rect), rect[:2],
+                     mask=self.giveProtectedPixels(rect))
+
+        self.updateStroke(rect)
 
     def erase(self, x, y):
         self.draw(x, y, (0, 0, 0, 0))
@@ -546,145 +605,128 @@ class SpriteTab(QWidget):
             indices[0], indices[1])
 
     def overdraw(self, x, y):
-        working_sprite = self.working_sprite
-        layer = self.currentActiveLayer()
-        sprite = layer.sprite
-        canvas_mask = Image.new(
-            '1', (self.canvas_width, self.canvas_height), color=1)
-        canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
+        if not self.stroke:
+            self.beginStroke()
 
-        coords = (self.base_x+sprite.x,
-                  self.base_y+sprite.y)
-
-        canvas.paste(working_sprite.image, coords, mask=working_sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
-
-        brushsize = self.main_window.giveBrushsize()
+        if self.stroke['canvas_working'] is None:
+            working_sprite = self.working_sprite
+            canvas_working = Image.new(
+                'RGBA', (self.canvas_width, self.canvas_height))
 
-        brushshape = self.main_window.giveBrushshape()
-
-        draw = ImageDraw.Draw(canvas_mask)
-        shade = 0
-        if brushsize != 1:
-            if brushshape == cwdg.BrushShapes.SQUARE:
-                draw.rectangle(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.ROUND:
-                draw.ellipse(
-                    [(x, y), (x+brushsize-1, y+brushsize-1)],  fill=shade)
-            elif brushshape == cwdg.BrushShapes.TILE:
-                x_mod = brushsize % 2
-                y_mod = brushsize % 2
-
-                for i in range(brushsize):
-                    if i < int(brushsize/2):
-                        draw.line([(x+i,  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod - int(i/2)), (x+i,
-                                  y-1+int(brushsize/2) - int((brushsize+1)/4)+y_mod + int(i/2))], fill=shade, width=1)
-                    else:
-                        draw.line(
-                            [(x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod -
-                              int((brushsize - i - 1) / 2)),
-                             (x + i, y - 1 + int(brushsize / 2) - int((brushsize + 1) / 4) + y_mod +
-                              int((brushsize - i - 1) / 2))],
-                            fill=shade, width=1)
+            coords = (self.base_x+working_sprite.x,
+                      self.base_y+working_sprite.y)
 
-        else:
-            draw.point((x, y), shade)
+            canvas_working.paste(working_sprite.image,
+                                 coords, mask=working_sprite.image)
+            self.stroke['canvas_working'] = canvas_working
 
-        if self.lastpos != (x, y):
-            x0, y0 = self.lastpos
-            if brushsize % 2 == 0:
-                x_mod = -1 if y > y0 else 0
-                y_mod = -1 if x > x0 else 0
-            else:
-                x_mod = 0
-                y_mod = 0
+            # brushed pixels are 0, they accumulate during the stroke
+            self.stroke['canvas_mask'] = Image.new(
+                '1', (self.canvas_width, self.canvas_height), color=1)
 
-            if brushshape == cwdg.BrushShapes.TILE:
-                brushsize = int(brushsize/2)
+        canvas = self.stroke['canvas']
 
-            draw.line([(int(x0+brushsize/2)+x_mod, int(y0+brushsize/2)+y_mod), (int(
-                x+brushsize/2)+x_mod, int(y+brushsize/2)+y_mod)], fill=shade, width=brushsize)
+        rect = self.drawBrush(ImageDraw.Draw(
+            self.stroke['canvas_mask']), x, y, 0)
+        if not rect:
+            return
 
-            self.lastpos = (x, y)
+        keep = ImageChops.logical_or(self.stroke['canvas_mask'].crop(
+            rect), self.giveProtectedPixels(rect))
+        region = self.stroke['canvas_working'].crop(rect)
+        region.paste(canvas.crop(rect), mask=keep)
+        canvas.paste(region, rect[:2])
 
-        canvas_mask.paste(self.protected_pixels, mask=self.protected_pixels)
+        self.updateStroke(rect)
 
-        canvas.paste(canvas_protect, mask=canvas_mask)
+    def fill(self, x, y, shade):
+        if not self.stroke:
+            self.beginStroke()
 
-        bbox = canvas.getbbox()
+        canvas = self.stroke['canvas']
 
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -self.base_x + bbox[0]
-            y_offset = -self.base_y + bbox[1]
-        else:
-            x_offset = 0
-            y_offset = 0
+        ImageDraw.floodfill(
+            canvas, (x, y), (shade[0], shade[1], shade[2], 255))
 
-        sprite.image = canvas
-        layer.setOffset(x_offset, y_offset)
+        canvas.paste(self.stroke['canvas_protect'], mask=self.giveProtectedPixels(
+            (0, 0, self.canvas_width, self.canvas_height)))
 
-        self.updateView()
+        self.endStroke()
 
-    def fill(self, x, y, shade):
+    def generateProtectionMask(self):
         layer = self.currentActiveLayer()
         sprite = layer.sprite
-        canvas = Image.new('RGBA', (self.canvas_width, self.canvas_height))
-        canvas_protect = Image.new(
-            'RGBA', (self.canvas_width, self.canvas_height))
 
         coords = (self.base_x+sprite.x,
                   self.base_y+sprite.y)
+        colors = self.main_window.tool_widget.color_select_panel.notSelectedColors()
+
+        # The mask only changes with the sprite, its position and the selected colors
+        key = (sprite.version, coords, frozenset(colors),
+               self.canvas_width, self.canvas_height)
+        if key != self.protected_pixels_key:
+            self.protected_pixels = Image.new(
+                '1', (self.canvas_width, self.canvas_height))
+            self.protected_pixels.paste(
+                sprite.giveProtectedPixelMask(colors), coords)
+            self.protected_pixels_key = key
 
-        canvas.paste(sprite.image, coords, mask=sprite.image)
-        canvas_protect.paste(sprite.image, coords, mask=sprite.image)
-
-        ImageDraw.floodfill(
-            canvas, (x, y), (shade[0], shade[1], shade[2], 255))
-
-        canvas.paste(canvas_protect, mask=self.protected_pixels)
-
-        bbox = canvas.getbbox()
-
-        if bbox:
-            canvas = canvas.crop(bbox)
-            x_offset = -self.base_x + bbox[0]
-            y_offset = -self.base_y + bbox[1]
+        if self.main_window.giveBrush() == cwdg.Brushes.AIRBRUSH:
+            self.airbrush_strength = self.main_window.giveAirbrushStrength()
+            self.airbrush_noise = np.zeros(
+                (self.canvas_height, self.canvas_width), dtype=bool)
+            self.airbrush_tiles = np.zeros((-(-self.canvas_height//AIRBRUSH_TILE),
+                                            -(-self.canvas_width//AIRBRUSH_TILE)), dtype=bool)
         else:
-            x_offset = 0
-            y_offset = 0
+            self.airbrush_strength = None
 
-        sprite.image = canvas
-        layer.setOffset(x_offset, y_offset)
+    def giveProtectedPixels(self, rect):
+        """Gives the protection mask in the region rect = (left, top, right, bottom) of the canvas.
+        The airbrush noise is generated tile by tile when a region is first used during a stroke."""
+        mask = self.protected_pixels.crop(rect)
 
-        self.updateView()
+        if self.airbrush_strength is None:
+            return mask
 
-    def generateProtectionMask(self):
-        layer = self.currentActiveLayer()
-        sprite = layer.sprite
+        left, top, right, bottom = rect
+        for tile_y in range(top//AIRBRUSH_TILE, -(-bottom//AIRBRUSH_TILE)):
+            for tile_x in range(left//AIRBRUSH_TILE, -(-right//AIRBRUSH_TILE)):
+                if self.airbrush_tiles[tile_y, tile_x]:
+                    continue
 
-        coords = (self.base_x+sprite.x,
-                  self.base_y+sprite.y)
+                tile = self.airbrush_noise[tile_y*AIRBRUSH_TILE:(tile_y+1)*AIRBRUSH_TILE,
+                                           tile_x*AIRBRUSH_TILE:(tile_x+1)*AIRBRUSH_TILE]
+                tile[:] = np.random.random(
+                    tile.shape) < 1-self.airbrush_strength
+                self.airbrush_tiles[tile_y, tile_x] = True
 
-        self.protected_pixels = Image.new(
-            '1', (self.canvas_width, self.canvas_height))
-        self.protected_pixels.paste(sprite.giveProtectedPixelMask(
-            self.main_window.tool_widget.color_select_panel.notSelectedColors()), coords)
+        noise_mask = Image.fromarray(self.airbrush_noise[top:bottom, left:right])
 
-        if self.main_window.giveBrush() == cwdg.Brushes.AIRBRUSH:
-            strength = self.main_window.giveAirbrushStrength()
-            noise_mask = Image.fromarray(np.random.choice(a=[True, False], size=(
-                self.canvas_width, self.canvas_height), p=[1-strength, strength]).T)
-            self.protected_pixels.paste(noise_mask, mask=noise_mask)
+        return ImageChops.logical_or(mask, noise_mask)
 
     def updateView(self, emit_signal=True):
-        self.active_layer.updateLayer()
+        # the layer is redrawn on the next frame, pen moves in between are coalesced
+        self.main_window.redraw_scheduler.request(
+            self.active_layer, 'layer', self.active_layer.updateLayer)
+        self.scheduleColorPanel()
         if emit_signal:
             self.layerUpdated.emit()
 
+    def scheduleColorPanel(self):
+        # the colors of the sprite are only marked once per frame, after the canvas
+        scheduler = self.main_window.redraw_scheduler
+        scheduler.request(self, 'color_panel',
+                          self.updateColorPanel, scheduler.LOW)
+
+    def updateColorPanel(self):
+        """Marks the colors of the active sprite in the color panel."""
+        layer = getattr(self, 'active_layer', None)
+        if layer is None or self.main_window.sprite_tabs.currentWidget() is not self:
+            return
+
+        self.main_window.tool_widget.color_select_panel.setPresentColors(
+            layer.sprite.colorsPresent())
+
     def updateLayersModel(self):
         if not self.locked:
             return
@@ -801,6 +843,7 @@ class SpriteTab(QWidget):
 
     def setCurrentActiveLayer(self, index, index_previous=None):
         self.active_layer = self.layers.itemFromIndex(index)
+        self.scheduleColorPanel()
 
     def currentActiveLayer(self):
         return self.active_layer
@@ -820,12 +863,14 @@ class SpriteTab(QWidget):
         self.object_tab.addSpriteToHistoryAllViews()
 
     def undo(self):
+        self.endStroke()
         layer = self.currentActiveLayer()
         layer.undo()
 
         self.updateView()
 
     def redo(self):
+        self.endStroke()
         layer = self.currentActiveLayer()
         layer.redo()
 
@@ -855,10 +900,8 @@ class SpriteTab(QWidget):
         if self.locked:
             self.object_tab.sprites_tab.copySpriteToClipboard()
         else:
-            image = ImageQt(self.active_layer.sprite.image)
-            pixmap = QtGui.QPixmap.fromImage(image)
-
-            QApplication.clipboard().setPixmap(pixmap)
+            QApplication.clipboard().setPixmap(
+                cwdg.toQPixmap(self.active_layer.sprite.image))
 
     def switchPalette(self, palette):
         if self.locked:
@@ -1184,6 +1227,8 @@ class SpriteViewWidget(QGraphicsView):
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
+        self.tab.endStroke()
+
         if event.button() == QtCore.Qt.LeftButton:
             if self.space_pressed:
                 self.viewport().setCursor(QtCore.Qt.OpenHandCursor)
@@ -1209,8 +1254,7 @@ class SpriteLayer(QtGui.QStandardItem):
         self.visible = True
 
         self.sprite = sprite
-        self.history = []
-        self.history_redo = []
+        self.history = SpriteHistory(memory_budget=32*2**20)
 
         self.setFlags(self.flags() | QtCore.Qt.ItemIsUserCheckable |
                       QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsEditable)
@@ -1236,41 +1280,20 @@ class SpriteLayer(QtGui.QStandardItem):
         self.item.setVisible(val)
 
     def addSpriteToHistory(self):
-        sprite = copy(self.sprite)
+        # the limits may have been changed in the settings since the last entry
+        settings = self.main_window.settings
+        self.history.memory_budget = settings.get('history_memory', 32)*2**20
+        self.history.maximum = settings.get('history_maximum', None)
 
-        if len(self.history) == self.main_window.settings['history_maximum']:
-            self.history.pop(0)
-
-        self.history.append(sprite)
-        self.history_redo = []
+        self.history.add(self.sprite)
 
     def undo(self):
-        if len(self.history) == 0:
-            return
-
-        sprite_new = self.history.pop(-1)
-
-        self.history_redo.append(copy(self.sprite))
-
-        self.sprite.image = sprite_new.image
-        self.sprite.x = sprite_new.x
-        self.sprite.y = sprite_new.y
-
-        self.updateLayer()
+        if self.history.undo(self.sprite):
+            self.updateLayer()
 
     def redo(self):
-        if len(self.history_redo) == 0:
-            return
-
-        sprite_new = self.history_redo.pop(-1)
-
-        self.history.append(copy(self.sprite))
-
-        self.sprite.image = sprite_new.image
-        self.sprite.x = sprite_new.x
-        self.sprite.y = sprite_new.y
-
-        self.updateLayer()
+        if self.history.redo(self.sprite):
+            self.updateLayer()
 
     def setSprite(self, sprite):
         if sprite:
@@ -1318,9 +1341,7 @@ class SpriteLayer(QtGui.QStandardItem):
         else:
             self.setSprite(sprite)
 
-        image = ImageQt(sprite.image)
-
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(sprite.image)
         self.updateOffset()
 
         self.item.setPixmap(pixmap)
@@ -1738,6 +1759,8 @@ class ChangeSettingsUi(QDialog):
         self.comboBox_palette.setCurrentIndex(settings.get('palette', 0))
         self.spinBox_history_maximum.setValue(
             settings.get('history_maximum', 5))
+        # not editable in the dialog, but kept
+        self.history_memory = settings.get('history_memory', 32)
 
         self.comboBox_background_color.setCurrentIndex(
             settings.get('background_color', 0))
@@ -1811,6 +1834,7 @@ class ChangeSettingsUi(QDialog):
         ), self.spinBox_G_background.value(), self.spinBox_B_background.value())
         settings['palette'] = self.comboBox_palette.currentIndex()
         settings['history_maximum'] = self.spinBox_history_maximum.value()
+        settings['history_memory'] = self.history_memory
 
         ss_defaults = {}
         for flag in cts.Jsmall_flags:
@@ -14,7 +14,6 @@ from PyQt5.QtWidgets import QMainWindow, QDialog, QMessageBox, QMenu, QGroupBox,
     QListWidget, QFileDialog, QGraphicsPixmapItem, QGraphicsScene, QSlider, QTableWidgetItem
 from PyQt5 import uic, QtGui, QtCore
 from PIL import Image, ImageGrab, ImageDraw
-from PIL.ImageQt import ImageQt
 from copy import copy
 import io
 import os.path
@@ -658,7 +657,7 @@ class SpritesTab(QWidget):
         self.setCurrentLayers(layers, view=view)
 
         self.updateLockedSpriteLayersModel()
-        self.updatePreview(view)
+        self.schedulePreview(view)
 
     def copySpriteToAllViews(self):
         rot = self.o.rotation
@@ -883,30 +882,27 @@ class SpritesTab(QWidget):
     def colorRemapToAll(self, index, color_remap, selected_colors):
         self.addSpriteToHistoryAllViews(index)
 
-        for rot in range(4):
-            sprite = self.layers[rot][index].sprite
-            for color in selected_colors:
-                sprite.remapColor(color, color_remap)
+        sprites = [self.layers[rot][index].sprite for rot in range(4)]
+        self.o.colorOperations(
+            [('remap', color, color_remap) for color in selected_colors], sprites)
 
         self.updateAllViews()
 
     def colorChangeBrightnessAll(self, index, step, selected_colors):
         self.addSpriteToHistoryAllViews(index)
 
-        for rot in range(4):
-            sprite = self.layers[rot][index].sprite
-            for color in selected_colors:
-                sprite.changeBrightnessColor(step, color)
+        sprites = [self.layers[rot][index].sprite for rot in range(4)]
+        self.o.colorOperations(
+            [('brightness', color, step) for color in selected_colors], sprites)
 
         self.updateAllViews()
 
     def colorRemoveAll(self, index, selected_colors):
         self.addSpriteToHistoryAllViews(index)
 
-        for rot in range(4):
-            sprite = self.layers[rot][index].sprite
-            for color in selected_colors:
-                sprite.removeColor(color)
+        sprites = [self.layers[rot][index].sprite for rot in range(4)]
+        self.o.colorOperations(
+            [('remove', color, None) for color in selected_colors], sprites)
 
         self.updateAllViews()
 
@@ -924,13 +920,12 @@ class SpritesTab(QWidget):
 
         coords = (76+x, height-70+y)
 
-        image = ImageQt(im)
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(im)
         self.sprite_view_main_item.setOffset(coords[0], coords[1])
 
         self.sprite_view_main_item.setPixmap(pixmap)
 
-        self.updatePreview(self.o.rotation)
+        self.schedulePreview(self.o.rotation)
         if emit_signal:
             self.object_tab.mainViewUpdated.emit()
 
@@ -950,14 +945,19 @@ class SpritesTab(QWidget):
 
         canvas = Image.new('RGBA', (72, 72))
         canvas.paste(im, coords)
-        image = ImageQt(canvas)
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(canvas)
         self.sprite_preview[rot].setPixmap(pixmap)
 
+    def schedulePreview(self, rot):
+        # previews are drawn with lower priority than the canvas and the main view
+        scheduler = self.main_window.redraw_scheduler
+        scheduler.request(self.sprite_preview[rot], 'preview',
+                          lambda: self.updatePreview(rot), scheduler.LOW)
+
     def updateAllViews(self):
         self.updateMainView()
         for rot in range(4):
-            self.updatePreview(rot)
+            self.schedulePreview(rot)
 
 
 class SpriteImportUi(QDialog):
@@ -11,8 +11,8 @@
 from PyQt5.QtWidgets import QMainWindow, QDialog, QApplication, QWidget, QGroupBox, QToolButton, QComboBox, QPushButton, QLineEdit, QLabel, QCheckBox, QSlider, QSpinBox, QDoubleSpinBox, QListWidget, QFileDialog
 from PyQt5 import uic, QtGui, QtCore
 from PIL import Image, ImageEnhance
-from PIL.ImageQt import ImageQt
 from customwidgets import ColorSelectWidget
+import customwidgets as cwdg
 import sys
 import io
 from os import getcwd
@@ -428,8 +428,7 @@ class PathGeneratorUi(QMainWindow):
             self.generator.base.show(), (86+self.generator.base.x, 50+self.generator.base.y), self.generator.base.image)
         canvas.paste(self.frame_image, self.frame_image)
 
-        image = ImageQt(canvas)
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(canvas)
         self.spriteViewLabel.setPixmap(pixmap)
 
         self.updatePreview(self.generator.current_rotation)
@@ -444,8 +443,7 @@ class PathGeneratorUi(QMainWindow):
         canvas.paste(im, coords, im)
         #canvas.paste(self.frame_image, self.frame_image)
 
-        image = ImageQt(canvas)
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(canvas)
         self.sprite_preview[rot].setPixmap(pixmap)
 
     def updateDisplayName(self):
@@ -648,8 +646,7 @@ class ImportSpriteUi(QDialog):
             base, (88+x, 66+y), base)
         canvas.paste(self.frame_image, self.frame_image)
 
-        image = ImageQt(canvas)
-        pixmap = QtGui.QPixmap.fromImage(image)
+        pixmap = cwdg.toQPixmap(canvas)
         self.spriteViewLabel.setPixmap(pixmap)
 
         self.updatePreview(base)
@@ -676,8 +673,7 @@ class ImportSpriteUi(QDialog):
             canvas.paste(
                 im, (3, 21), im)
 
-            image = ImageQt(canvas)
-            pixmap = QtGui.QPixmap.fromImage(image)
+            pixmap = cwdg.toQPixmap(canvas)
             self.spritePreviewLabel.setPixmap(pixmap)
 
 
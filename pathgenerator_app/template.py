@@ -8,11 +8,14 @@
  *****************************************************************************
 """
 
-from json import load, dump
+from json import loads, dump
 from os import mkdir, replace
 from PIL import Image
-from shutil import unpack_archive, make_archive
+from shutil import make_archive
 from tempfile import TemporaryDirectory
+from zipfile import ZipFile
+from io import BytesIO
+from posixpath import normpath
 
 
 class PathTemplate:
@@ -28,11 +31,10 @@ class PathTemplate:
     @classmethod
     def fromFile(cls, path: str):
         """Instantiates a new object from a .template file."""
-        with TemporaryDirectory() as temp:
-            unpack_archive(filename=path, extract_dir=temp, format='zip')
+        with ZipFile(path) as archive:
             # Raises error on incorrect object structure or missing json:
             try:
-                data_raw = load(fp=open(f'{temp}/object.json'))
+                data_raw = loads(archive.read('object.json'))
             except:
                 print(
                     f'Warning: template file {path} corrupted. Skipped loading.')
@@ -56,8 +58,7 @@ class PathTemplate:
                     continue
 
                 images[im['path']] = Image.open(
-                    f'{temp}/{im["path"]}').convert('RGBA')
-
+                    BytesIO(archive.read(normpath(im['path'].replace('\\', '/'))))).convert('RGBA')
 
         return cls(data=data, images=images, num_tiles=num_tiles, is_small=is_small)
 
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+*****************************************************************************
+ * Copyright (c) 2024 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Benchmark of datloader.rle_decode against the former decoder, which appended every byte
+to a list. Decodes a synthetic chunk and, if a folder is given, the chunks of all .DAT files
+below it, and checks that both decoders give the same bytes.
+
+    python benchmarks/rle_decode.py [folder]
+"""
+
+import sys
+from os import walk
+from os.path import join, splitext
+from random import Random
+from timeit import repeat
+
+from rctobject.datloader import rle_decode
+
+
+def rle_decode_list(string: bytes):
+    """The decoder before the slice writes, kept for comparison."""
+    srcLength = len(string)
+    output = []
+    i = 5
+    if i >= srcLength:
+        return False
+
+    if string[0] == 0:
+        return string[5:]
+    if string[0] != 1:
+        return False
+
+    while i < srcLength:
+        byte = string[i]
+        i += 1
+        if (byte & 0x80) == 0:
+            copy = byte + 1
+            if copy + i > srcLength:
+                raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE', copy, byte, i)
+
+            for c in string[i:i + copy]:
+                output.append(c)
+            i += copy
+
+        else:
+            repeat = (~byte & 0xff)+2
+            if i + 1 > srcLength:
+                raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE')
+
+            repeated_byte = string[i]
+            i += 1
+
+            for j in range(repeat):
+                output.append(repeated_byte)
+
+    return bytes(output)
+
+
+def syntheticChunk(size: int = 2**21, seed: int = 0):
+    """Gives a RLE chunk of about size decoded bytes, mixing literal runs with repeats of
+    transparent pixels as in sprite data."""
+    random = Random(seed)
+    body = bytearray()
+    decoded = 0
+
+    while decoded < size:
+        if random.random() < 0.5:
+            copy = random.randint(1, 128)
+            body.append(copy - 1)
+            body += bytes(random.randrange(256) for _ in range(copy))
+            decoded += copy
+        else:
+            repeat = random.randint(2, 129)
+            body.append(~(repeat - 2) & 0xff)
+            body.append(0)
+            decoded += repeat
+
+    return bytes([1]) + len(body).to_bytes(4, 'little') + bytes(body)
+
+
+def datChunks(folder: str):
+    for root, _, filenames in walk(folder):
+        for filename in filenames:
+            if splitext(filename)[1].lower() == '.dat':
+                with open(join(root, filename), 'rb') as file:
+                    yield file.read()[16:]
+
+
+def bench(name: str, chunks: list, number: int = 3):
+    for chunk in chunks:
+        if rle_decode(chunk) != rle_decode_list(chunk):
+            raise RuntimeError(f'Decoders disagree on {name}.')
+
+    encoded = sum(len(chunk) for chunk in chunks)
+    print(f'{name}: {len(chunks)} chunk(s), {encoded/1000:.0f} kB encoded')
+    for decoder in [rle_decode_list, rle_decode]:
+        best = min(repeat(lambda: [decoder(chunk) for chunk in chunks],
+                          number=1, repeat=number))
+        print(f'  {decoder.__name__:16} {best*1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    bench('synthetic', [syntheticChunk()])
+
+    if len(sys.argv) > 1:
+        bench(sys.argv[1], list(datChunks(sys.argv[1])))
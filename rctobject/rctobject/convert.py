@@ -0,0 +1,130 @@
+"""
+*****************************************************************************
+ * Copyright (c) 2024 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Headless bulk conversion of .DAT objects to .parkobj files.
+
+Usage:
+    python -m rctobject.convert <input folder> <output folder> [--author-id ID] [--jobs N]
+
+The input folder is walked recursively and every .DAT file is written to the same
+relative folder in the output, named after the DAT file. Files whose output is newer
+than the input are skipped, so an interrupted run can simply be started again.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import walk, makedirs, cpu_count
+from os.path import join, split, relpath, splitext, exists, getmtime
+import sys
+import traceback
+
+import rctobject.objects as obj
+
+
+def findDatFiles(folder: str):
+    """Returns the sorted list of all .DAT files in folder and its subfolders."""
+    files = []
+    for root, dirs, filenames in walk(folder):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if splitext(filename)[1].lower() == '.dat':
+                files.append(join(root, filename))
+
+    return files
+
+
+def outputPath(filepath: str, input_folder: str, output_folder: str):
+    """Gives folder and name (without extension) of the converted file."""
+    rel_folder, filename = split(relpath(filepath, input_folder))
+    return join(output_folder, rel_folder), splitext(filename)[0]
+
+
+def isUpToDate(filepath: str, folder: str, name: str):
+    target = join(folder, f'{name}.parkobj')
+    return exists(target) and getmtime(target) > getmtime(filepath)
+
+
+def convertFile(filepath: str, folder: str, name: str, author_id: str, include_originalId: bool = False):
+    """Converts a single .DAT file. Returns None on success, else the error message.
+    Runs in the worker processes, so nothing may be raised from here. There is a process per
+    core already, so the sprites are handled on a single thread."""
+    try:
+        o = obj.load(filepath, workers=1)
+        if not o.data.get('id'):
+            o['id'] = f'{author_id}.{o.object_type.value}.{o.old_id}'
+
+        makedirs(folder, exist_ok=True)
+        o.save(folder, name=name, include_originalId=include_originalId, workers=1)
+    except Exception:
+        return ''.join(traceback.format_exception_only(*sys.exc_info()[:2])).strip()
+
+    return None
+
+
+def convertFolder(input_folder: str, output_folder: str, author_id: str = 'custom', jobs: int = None,
+                  include_originalId: bool = False, force: bool = False, out=sys.stdout):
+    """Converts all .DAT files of input_folder on a process pool, reporting progress to out.
+    Returns a dict of the failed files with their error messages."""
+    files = findDatFiles(input_folder)
+    total = len(files)
+
+    tasks = []
+    skipped = 0
+    for filepath in files:
+        folder, name = outputPath(filepath, input_folder, output_folder)
+        if not force and isUpToDate(filepath, folder, name):
+            skipped += 1
+            continue
+        tasks.append((filepath, folder, name))
+
+    if skipped:
+        print(f'Skipping {skipped} of {total} files that are up to date.', file=out)
+
+    errors = {}
+    with ProcessPoolExecutor(max_workers=jobs or cpu_count()) as executor:
+        futures = {executor.submit(convertFile, filepath, folder, name, author_id, include_originalId): filepath
+                   for filepath, folder, name in tasks}
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            filepath = futures[future]
+            error = future.result()
+            if error:
+                errors[filepath] = error
+                print(f'[{done}/{len(tasks)}] FAILED {filepath}: {error}', file=out)
+            else:
+                print(f'[{done}/{len(tasks)}] {filepath}', file=out)
+            out.flush()
+
+    print(f'Converted {len(tasks)-len(errors)} files, {len(errors)} failed, {skipped} skipped.', file=out)
+
+    return dict(sorted(errors.items()))
+
+
+def main(argv=None):
+    parser = ArgumentParser(prog='python -m rctobject.convert',
+                            description='Convert all .DAT objects of a folder to .parkobj files.')
+    parser.add_argument('input', help='folder containing the .DAT files')
+    parser.add_argument('output', help='folder the .parkobj files are written to')
+    parser.add_argument('--author-id', default='custom',
+                        help='author id used for the object id <author-id>.<type>.<DAT id>')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--keep-dat-id', action='store_true',
+                        help='keep the originalId of the DAT object in the json')
+    parser.add_argument('--force', action='store_true',
+                        help='also convert files whose output is up to date')
+    args = parser.parse_args(argv)
+
+    errors = convertFolder(args.input, args.output, args.author_id, args.jobs,
+                           args.keep_dat_id, args.force)
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
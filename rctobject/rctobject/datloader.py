@@ -12,11 +12,14 @@
 
 from struct import unpack
 from json import dump, loads
-from os.path import splitext, exists
+from os import walk
+from os.path import splitext, exists, join
 from shutil import unpack_archive, make_archive, move, rmtree
 from tempfile import TemporaryDirectory
 from subprocess import run
+from functools import partial
 from PIL import Image
+import numpy as np
 
 import rctobject.constants as const
 import rctobject.sprites as spr
@@ -24,8 +27,9 @@ import rctobject.palette as pal
 
 
 def rle_decode(string: bytes):
+    """Decodes a RLE encoded DAT chunk. Literal runs and repeats are appended as whole slices."""
     srcLength = len(string)
-    output = []
+    output = bytearray()
     i = 5
     if i >= srcLength:
         return False
@@ -43,8 +47,7 @@ def rle_decode(string: bytes):
             if copy + i > srcLength:
                 raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE', copy, byte, i)
 
-            for c in string[i:i + copy]:
-                output.append(c)
+            output += string[i:i + copy]
             i += copy
 
         else:
@@ -52,12 +55,9 @@ def rle_decode(string: bytes):
             if i + 1 > srcLength:
                 raise RuntimeError('EXCEPTION_MSG_CORRUPT_RLE')
 
-            repeated_byte = string[i]
+            output += string[i:i + 1]*repeat
             i += 1
 
-            for j in range(repeat):
-                output.append(repeated_byte)
-
     return bytes(output)
 
 
@@ -256,16 +256,28 @@ def read_string_table(data, pos):
     return string_table, pos
 
 
-def loadDatObject(filename: str):
+def read_header(header: bytes):
+    """Reads the 16 byte header of a DAT file. Returns the object flag byte and the flags, name
+    and checksum strings as used in the originalId."""
+    if len(header) < 16:
+        raise RuntimeError('DAT-file corrupted. Header too short.')
+
+    object_flag = header[0]
+    flag_string = hex(unpack('<L', header[:4])[0])[2:].upper().zfill(8)
+    name = header[4:12].decode('utf-8')
+    checksum = hex(unpack('<L', header[12:16])[0])[2:].upper().zfill(8)
+
+    return object_flag, flag_string, name, checksum
+
+
+def loadDatObject(filename: str, lazy: bool = False):
+    """Reads a .DAT file and returns the JSON data and the sprites of the object. When lazy is
+    set, the sprites are only decoded once their image is accessed."""
     result = {}
     tags = {}
 
     with open(filename, "rb") as f:
-        header = f.read(16)
-        object_flag = header[0]
-        flag_string = hex(unpack('<L', header[:4])[0])[2:].upper().zfill(8)
-        name = header[4:12].decode('utf-8')
-        checksum = hex(unpack('<L', header[12:16])[0])[2:].upper().zfill(8)
+        object_flag, flag_string, name, checksum = read_header(f.read(16))
         result['id'] = ''
         result['version'] = '1.0'
         result['SourceGame'] = get_source(object_flag)
@@ -293,7 +305,7 @@ def loadDatObject(filename: str):
             pos += 16
             pos = tag_small_scenery_scan_optional(chunk, tags, pos)
 
-            result['images'], sprites = read_image_table(chunk, pos)
+            result['images'], sprites = read_image_table(chunk, pos, lazy)
             # if(result["image"] == =FALSE)return FALSE
 
         elif object_type == 'scenery_large':
@@ -312,7 +324,7 @@ def loadDatObject(filename: str):
             pos += 16
             tags['tiles'], pos = large_scenery_scan_optional(chunk, pos)
 
-            result['images'], sprites = read_image_table(chunk, pos)
+            result['images'], sprites = read_image_table(chunk, pos, lazy)
         else:
             raise NotImplementedError(
                 f'dat-Import of {object_type} not supported.')
@@ -390,7 +402,7 @@ def loadDatObject(filename: str):
     # 		if(result["image"] == =FALSE)return FALSE
 
 
-def read_image_table(data, graphic_base):
+def read_image_table(data, graphic_base, lazy: bool = False):
 
     length = len(data)
     if graphic_base >= length-3:
@@ -412,66 +424,105 @@ def read_image_table(data, graphic_base):
         im['path'] = f'images/{index}.png'
 
         base_pos = 8+graphic_base+16*index
-        offset = unpack('L', data[base_pos:base_pos+4])[0]
+        offset = unpack('<L', data[base_pos:base_pos+4])[0]
         width, height, im['x'], im['y'] = unpack(
-            '4h', data[base_pos+4:base_pos+12])
-
-        flag = unpack('H', data[base_pos+12:base_pos+14])[0]
-
-        image = Image.new('RGBA', (width, height))
-
-        if flag & 0x4:
-            image_base = bitmap_base+offset
-            if image_base+2*height > length:
-                raise RuntimeError(
-                    f'Length of image data {image_base+2*height} larger than length of image data {length}.')
-            for row in range(height):
-                row_data = image_base + \
-                    unpack('H', data[image_base+row*2:image_base+row*2+2])[0]
-
-                last = 0
-                while True:
-                    if row_data > length:
-                        raise RuntimeError(f'Length of row data {row_data} larger than length of image data {length}.')
-
-                    seg_length = data[row_data] & 0x7F
-                    last = data[row_data] & 0x80
-                    row_data += 1
-                    if row_data > length:
-                        raise RuntimeError(f'Length of row data {row_data} larger than length of image data {length}.')
-
-                    x_offset = data[row_data]
-                    row_data += 1
-                    for x in range(seg_length):
-                        if row_data > length:
-                            raise RuntimeError(
-                                f'Length of row data {row_data} larger than length of image data {length}.')
-                        image.putpixel(
-                            (x+x_offset, row), tuple(pal.complete_palette_array[data[row_data]]))
-                        row_data += 1
-
-                    if last == 0x80:
-                        break
-        else:
-            pixel = bitmap_base + offset
-            if pixel+width*height > length:
-                raise RuntimeError(
-                    f'Length of pixel image data {pixel+width*height} larger than length of image data {length}.')
-            for y in range(height):
-                for x in range(width):
-                    image.putpixel(
-                        (x, y), tuple(pal.complete_palette_array[data[pixel]]))
-                    pixel += 1
+            '<4h', data[base_pos+4:base_pos+12])
+
+        flag = unpack('<H', data[base_pos+12:base_pos+14])[0]
 
         images.append(im)
-        sprites[im['path']] = spr.Sprite(image, (im['x'], im['y']))
+        if lazy:
+            sprites[im['path']] = spr.LazySprite(
+                partial(read_image, data, bitmap_base+offset, width, height, flag), (im['x'], im['y']))
+        else:
+            image = read_image(data, bitmap_base+offset, width, height, flag)
+            sprites[im['path']] = spr.Sprite(image, (im['x'], im['y']))
 
     return images, sprites
 
 
+def read_image(data, image_base, width, height, flag):
+    """Decodes one image of the graphics table. The palette indices of every row segment are written
+    into an index array which is converted to RGBA with a single palette lookup."""
+    length = len(data)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    indices = np.zeros((height, width), dtype=np.uint8)
+
+    if flag & 0x4:
+        visible = np.zeros((height, width), dtype=bool)
+
+        if image_base+2*height > length:
+            raise RuntimeError(
+                f'Length of image data {image_base+2*height} larger than length of image data {length}.')
+        row_offsets = unpack(f'<{height}H', data[image_base:image_base+2*height])
+
+        for row in range(height):
+            row_data = image_base + row_offsets[row]
+
+            last = 0
+            while True:
+                if row_data+1 >= length:
+                    raise RuntimeError(f'Length of row data {row_data+1} larger than length of image data {length}.')
+
+                seg_length = data[row_data] & 0x7F
+                last = data[row_data] & 0x80
+                x_offset = data[row_data+1]
+                row_data += 2
+
+                if row_data+seg_length > length:
+                    raise RuntimeError(
+                        f'Length of row data {row_data+seg_length} larger than length of image data {length}.')
+                if x_offset+seg_length > width:
+                    raise RuntimeError(
+                        f'Row segment {x_offset+seg_length} larger than image width {width}.')
+
+                indices[row, x_offset:x_offset+seg_length] = buffer[row_data:row_data+seg_length]
+                visible[row, x_offset:x_offset+seg_length] = True
+                row_data += seg_length
+
+                if last == 0x80:
+                    break
+    else:
+        pixel = image_base
+        if pixel+width*height > length:
+            raise RuntimeError(
+                f'Length of pixel image data {pixel+width*height} larger than length of image data {length}.')
+        indices[:, :] = buffer[pixel:pixel+width*height].reshape(height, width)
+        visible = np.ones((height, width), dtype=bool)
+
+    image = pal.complete_palette_rgba[indices]
+    image[~visible] = 0
+
+    return Image.fromarray(image, 'RGBA')
+
+
 def import_sprites(dat_id, openpath):
+    """Reads the image list and sprites of the DAT object dat_id from the /object folder of the
+    OpenRCT2 directory openpath. DATs outside of that folder (e.g. in the ObjData of RCT2) and
+    object types that loadDatObject cannot read are exported with OpenRCT2 instead."""
+    filepath = find_dat_file(dat_id, f'{openpath}/object')
+    if not filepath:
+        # OpenRCT2 also finds the DATs of its object repository
+        if exists(f'{openpath}/bin/openrct2.exe'):
+            return export_sprites(dat_id, openpath)
+        raise RuntimeError(f'Could not find {dat_id}.DAT. \n \
+                           For .DAT-import the object has to lie in the /object folder of your OpenRCT2 directory.')
+
+    try:
+        data, sprites = loadDatObject(filepath)
+    except NotImplementedError:
+        return export_sprites(dat_id, openpath)
+
+    # images is the list for the json with offset data, sprites is the dict with the sprites for the object
+    return data['images'], sprites
+
+
+def export_sprites(dat_id, openpath):
+    """Exports the sprites of the DAT object dat_id with the sprite command of OpenRCT2."""
     if not exists(f'{openpath}/bin/openrct2.exe'):
-        raise RuntimeError('Could not find openrct.exe in specified OpenRCT2 path.')
+        raise RuntimeError(f'{dat_id}.DAT is of an object type that can only be imported with OpenRCT2, \n \
+                           but openrct2.exe could not be found in specified OpenRCT2 path.')
 
     with TemporaryDirectory() as temp:
         temp = temp.replace('\\', '/')
@@ -497,6 +548,21 @@ def import_sprites(dat_id, openpath):
     return images, sprites
 
 
+def find_dat_file(dat_id, folder):
+    """Gives the path of the .DAT file of dat_id in folder or its subfolders (case insensitive), None if not found."""
+    filepath = f'{folder}/{dat_id}.DAT'
+    if exists(filepath):
+        return filepath
+
+    filename = f'{dat_id}.dat'.lower()
+    for root, _, filenames in walk(folder):
+        for name in filenames:
+            if name.lower() == filename:
+                return join(root, name)
+
+    return None
+
+
 def findKnowAuthor(dat_id):
     for author_id, author in known_author_ids.items():
         if dat_id.startswith(author_id):
@@ -0,0 +1,183 @@
+"""
+*****************************************************************************
+ * Copyright (c) 2024 Tolsimir
+ *
+ * The program "Object Creator" and all subsequent modules are licensed
+ * under the GNU General Public License version 3.
+ *****************************************************************************
+
+Persistent metadata index of the .DAT objects in an OpenRCT2 object folder.
+
+The index is stored in a SQLite file and holds the header fields, author, strings and
+properties of every object. update() only rereads files whose modification time or size
+changed since the last scan, so keeping the index current is cheap after the first run.
+
+    index = ObjectIndex('C:/OpenRCT2/object', 'object_index.sqlite')
+    index.update()
+    index.find(name='bench', object_type='scenery_small')
+"""
+
+import sqlite3
+from json import dumps, loads
+from os import walk, stat
+from os.path import join, splitext, abspath
+
+import rctobject.datloader as dat
+
+SCHEMA_VERSION = 2
+
+COLUMNS = ['path', 'mtime', 'size', 'flags', 'dat_id', 'checksum', 'object_type', 'source_game',
+           'author', 'name', 'scenery_group', 'strings', 'properties', 'error']
+
+
+class ObjectIndex:
+    """Metadata index of all .DAT files below folder, stored in index_path."""
+
+    def __init__(self, folder: str, index_path: str):
+        self.folder = abspath(folder)
+        self.index_path = index_path
+
+        self.connection = sqlite3.connect(index_path)
+        self.connection.row_factory = sqlite3.Row
+
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS objects')
+
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS objects (
+                path TEXT PRIMARY KEY,
+                mtime REAL,
+                size INTEGER,
+                flags TEXT,
+                dat_id TEXT COLLATE NOCASE,
+                checksum TEXT,
+                object_type TEXT,
+                source_game TEXT,
+                author TEXT,
+                name TEXT,
+                scenery_group TEXT,
+                strings TEXT,
+                properties TEXT,
+                error TEXT);
+            CREATE INDEX IF NOT EXISTS objects_dat_id ON objects (dat_id);
+            CREATE INDEX IF NOT EXISTS objects_type ON objects (object_type);
+            CREATE INDEX IF NOT EXISTS objects_group ON objects (scenery_group);
+            CREATE INDEX IF NOT EXISTS objects_author ON objects (author);
+            PRAGMA user_version = {SCHEMA_VERSION};
+            """)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, progress=None):
+        """Rescans the folder. Only new or changed files are read, entries of deleted files are removed.
+        progress is an optional callable receiving (number done, number of files to read).
+        Returns the number of (re)read and of removed entries."""
+        known = {row['path']: (row['mtime'], row['size'])
+                 for row in self.connection.execute('SELECT path, mtime, size FROM objects')}
+
+        changed = []
+        present = set()
+        for root, _, filenames in walk(self.folder):
+            for filename in filenames:
+                if splitext(filename)[1].lower() != '.dat':
+                    continue
+                path = join(root, filename)
+                present.add(path)
+                st = stat(path)
+                if known.get(path) != (st.st_mtime, st.st_size):
+                    changed.append((path, st.st_mtime, st.st_size))
+
+        removed = [path for path in known if path not in present]
+
+        with self.connection:
+            self.connection.executemany('DELETE FROM objects WHERE path = ?', [(path,) for path in removed])
+
+            for i, (path, mtime, size) in enumerate(changed):
+                entry = readEntry(path)
+                entry['mtime'] = mtime
+                entry['size'] = size
+                self.connection.execute(
+                    f'INSERT OR REPLACE INTO objects ({", ".join(COLUMNS)}) VALUES ({", ".join("?"*len(COLUMNS))})',
+                    [entry.get(column) for column in COLUMNS])
+                if progress:
+                    progress(i+1, len(changed))
+
+        return len(changed), len(removed)
+
+    def get(self, dat_id: str):
+        """Returns the entry of the object with given DAT identifier or None."""
+        row = self.connection.execute(
+            'SELECT * FROM objects WHERE dat_id = ?', (dat_id.strip(),)).fetchone()
+
+        return _toEntry(row) if row else None
+
+    def find(self, name: str = None, author: str = None, object_type: str = None, scenery_group: str = None,
+             dat_id: str = None, limit: int = None):
+        """Returns all entries matching the given filters. name, author and dat_id match
+        case-insensitive substrings, object_type and scenery_group match exactly."""
+        conditions = []
+        values = []
+
+        for column, value in [('name', name), ('author', author), ('dat_id', dat_id)]:
+            if value:
+                conditions.append(f'{column} LIKE ?')
+                values.append(f'%{value}%')
+
+        for column, value in [('object_type', object_type), ('scenery_group', scenery_group)]:
+            if value:
+                conditions.append(f'{column} = ?')
+                values.append(value)
+
+        query = 'SELECT * FROM objects'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY dat_id'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+
+        return [_toEntry(row) for row in self.connection.execute(query, values)]
+
+
+def readEntry(path: str):
+    """Reads the index entry of a single .DAT file. Objects that cannot be read completely
+    are still indexed with their header fields and the error message."""
+    entry = {'path': path}
+
+    try:
+        with open(path, 'rb') as f:
+            object_flag, entry['flags'], name, entry['checksum'] = dat.read_header(f.read(16))
+        entry['dat_id'] = name.strip()
+        entry['source_game'] = dat.get_source(object_flag)
+        entry['author'] = dat.findKnowAuthor(name)
+        entry['object_type'] = dat.get_object_type(object_flag)
+
+        data, _ = dat.loadDatObject(path, lazy=True)
+        entry['strings'] = dumps(data['strings'])
+        entry['properties'] = dumps(data['properties'])
+        entry['name'] = data['strings']['name'].get('en-GB', '')
+        entry['scenery_group'] = data.get('sceneryGroup', '').strip() or None
+    except Exception as e:
+        entry['error'] = f'{type(e).__name__}: {e}'
+
+    return entry
+
+
+def _toEntry(row):
+    entry = dict(row)
+    for key in ['strings', 'properties']:
+        if entry[key] is not None:
+            entry[key] = loads(entry[key])
+
+    return entry
@@ -17,17 +17,21 @@ Created 09/26/2021; 16:58:33
 
 """
 
-from json import dump, loads
+from json import dumps, loads
 from json import load as jload
-from os import mkdir, makedirs, replace, getcwd
+from os import makedirs, replace, remove, getcwd, cpu_count, chmod, umask
 from os.path import splitext, exists
 import copy
 from PIL import Image
-from shutil import unpack_archive, make_archive, move, rmtree
-from tempfile import TemporaryDirectory
-from subprocess import run
+from shutil import rmtree
+from tempfile import NamedTemporaryFile
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+from io import BytesIO
+from posixpath import normpath
 import numpy as np
 from enum import Enum
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import rctobject.sprites as spr
 import rctobject.palette as pal
@@ -36,6 +40,13 @@ import rctobject.constants as cts
 
 OPENRCTPATH = '%USERPROFILE%\\Documents\\OpenRCT2'
 
+# Default number of threads for the sprites of an object (see _mapThreads), None uses one per core
+LOAD_WORKERS = None
+
+# Objects with at least this many sprites (e.g. clocks with their image sets) are kept as palette
+# indices by the editor, see RCTObject.compactSprites
+COMPACT_MIN_SPRITES = 64
+
 
 class RCTObject:
     """Base class for all editable objects; loads from .parkobj or .DAT files."""
@@ -64,12 +75,11 @@ class RCTObject:
         self.data[item] = value
 
     @classmethod
-    def fromParkobj(cls, filepath: str, openpath: str = OPENRCTPATH):
+    def fromParkobj(cls, filepath: str, openpath: str = OPENRCTPATH, workers: int = None):
         """Instantiates a new object from a .parkobj file."""
-        with TemporaryDirectory() as temp:
-            unpack_archive(filename=filepath, extract_dir=temp, format='zip')
+        with ZipFile(filepath) as archive:
             # Raises error on incorrect object structure or missing json:
-            data = jload(fp=open(f'{temp}/object.json', encoding='utf-8'))
+            data = loads(archive.read('object.json').decode('utf-8'))
             dat_id = data.get('originalId', None)
             # If an original Id was given and the sprites are supposed to be loaded from the dat file we do so (aka "official" openRCT objects).
             if isinstance(data['images'][0], str) and dat_id:
@@ -79,10 +89,10 @@ class RCTObject:
             # If no original dat is given, the images are assumed to lie in the relative path given in the json (zipped parkobj).
             # We change the data structure to "images/i.png" for i = image index.
             elif isinstance(data['images'][0], dict):
-                sprites = {}
+                # the images are read into memory here, the archive is not shared with the workers
+                sprites = _loadSprites(
+                    [(BytesIO(archive.read(_zipMember(im['path']))), (im['x'], im['y'])) for im in data['images']], workers)
                 for i, im in enumerate(data['images']):
-                    sprites[f'images/{i}.png'] = spr.Sprite.fromFile(
-                        f'{temp}/{im["path"]}', coords=(im['x'], im['y']))
                     im['path'] = f'images/{i}.png'
             else:
                 raise RuntimeError('Cannot extract images.')
@@ -90,7 +100,7 @@ class RCTObject:
         return cls(data=data, sprites=sprites, old_id=dat_id)
 
     @classmethod
-    def fromJson(cls, filepath: str, openpath: str = OPENRCTPATH):
+    def fromJson(cls, filepath: str, openpath: str = OPENRCTPATH, workers: int = None):
         """Instantiates a new object from a .json file. openpath has to be according to the system's 
            openrct2 folder location if sprite refers to a dat-file."""
         data = jload(fp=open(filepath, encoding='utf8'))
@@ -103,11 +113,10 @@ class RCTObject:
         # If no original dat is given, the images are assumed to lie in the relative path given in the json (unzipped parkobj).
         # The file is assumed to be called "object.json" in this case.
         elif isinstance(data['images'][0], dict):
-            sprites = {}
             filename_len = len(filepath.split('/')[-1])
+            sprites = _loadSprites(
+                [(f'{filepath[:-filename_len]}{im["path"]}', (im['x'], im['y'])) for im in data['images']], workers)
             for i, im in enumerate(data['images']):
-                sprites[f'images/{i}.png'] = spr.Sprite.fromFile(
-                    f'{filepath[:-filename_len]}{im["path"]}', coords=(im['x'], im['y']))
                 im['path'] = f'images/{i}.png'
         else:
             raise RuntimeError('Cannot extract images.')
@@ -115,16 +124,18 @@ class RCTObject:
         return cls(data=data, sprites=sprites, old_id=dat_id)
 
     @classmethod
-    def fromDat(cls, filepath: str):
-        """Instantiates a new object from a .DAT file."""
+    def fromDat(cls, filepath: str, lazy: bool = False):
+        """Instantiates a new object from a .DAT file. With lazy the sprites are decoded on first access."""
 
-        data, sprites = dat.loadDatObject(filepath)
+        data, sprites = dat.loadDatObject(filepath, lazy)
         dat_id = data['originalId'].split('|')[1].replace(' ', '')
 
         return cls(data=data, sprites=sprites, old_id=dat_id)
 
-    def save(self, path: str = None, name: str = None, no_zip: bool = False, include_originalId: bool = False):
-        """Saves an object as .parkobj file to specified path."""
+    def save(self, path: str = None, name: str = None, no_zip: bool = False, include_originalId: bool = False,
+             compression: int = ZIP_DEFLATED, compresslevel: int = None, workers: int = None):
+        """Saves an object as .parkobj file to specified path. compression and compresslevel are
+        those of zipfile, e.g. ZIP_STORED skips compressing the already compressed images."""
         if not path:
             path = getcwd()
 
@@ -167,26 +178,37 @@ class RCTObject:
             filename = f'{path}/{self.data["id"]}'
             name = self.data["id"]
 
-        with TemporaryDirectory() as temp:
-            mkdir(f'{temp}/images')
-
-            for im in self['images']:
-                sprite = self.sprites[im['path']]
-                sprite.save(f"{temp}/{im['path']}")
-
-            with open(f'{temp}/object.json', mode='w') as file:
-                dump(obj=self.data, fp=file, indent=2)
-
-            make_archive(base_name=f'{filename}',
-                         root_dir=temp, format='zip')
-
-            replace(f'{filename}.zip', f'{filename}.parkobj')
-            if no_zip:
-                rmtree(filename, ignore_errors=True)
-                makedirs(filename, exist_ok=True)
-               # mkdir(f'{filename}/images')
-                move(f'{temp}/images', filename)
-                move(f'{temp}/object.json', filename)
+        files = {'object.json': dumps(self.data, indent=2).encode('utf-8')}
+        members = [im['path'] for im in self['images']]
+        files.update(zip(members, _mapThreads(
+            lambda member: self.sprites[member].encodePng(), members, workers)))
+
+        # Write next to the target and rename, so an existing file is only replaced once
+        # the new one is complete
+        with NamedTemporaryFile(dir=path, prefix=f'{name}.', suffix='.tmp', delete=False) as file:
+            temp = file.name
+            try:
+                with ZipFile(file, mode='w', compression=compression, compresslevel=compresslevel) as archive:
+                    for member, content in files.items():
+                        archive.writestr(_zipInfo(member, compression), content,
+                                         compresslevel=compresslevel)
+            except BaseException:
+                file.close()
+                remove(temp)
+                raise
+
+        # temporary files are only readable by the owner, give it the usual permissions
+        mask = umask(0)
+        umask(mask)
+        chmod(temp, 0o666 & ~mask)
+        replace(temp, f'{filename}.parkobj')
+
+        if no_zip:
+            rmtree(filename, ignore_errors=True)
+            makedirs(f'{filename}/images', exist_ok=True)
+            for member, content in files.items():
+                with open(f'{filename}/{member}', mode='wb') as file:
+                    file.write(content)
 
     def size(self):
         'gives size in game coordinates; to be defined in subclass'
@@ -203,10 +225,28 @@ class RCTObject:
 
         return (width, height)
 
-    def switchPalette(self, palette):
-        self.palette = palette
+    def switchPalette(self, palette, workers: int = None):
+        """Switches all sprites to palette."""
+        switchPalettes([self], palette, workers)
+
+    def colorOperations(self, operations: list, sprites: list = None, workers: int = None):
+        """Applies the color operations (see sprites.colorIndexLut) to sprites, by default all."""
+        if sprites is None:
+            sprites = list(self.sprites.values())
+
+        _mapThreads(lambda sprite: sprite.colorOperations(
+            operations), sprites, workers)
+
+    def compactSprites(self, min_sprites: int = 0):
+        """Keeps the sprites only as palette indices to save memory, see Sprite.compact.
+        Lazy sprites that were not decoded yet are left alone, as are objects with fewer
+        than min_sprites sprites."""
+        if len(self.sprites) < min_sprites:
+            return
+
         for _, sprite in self.sprites.items():
-            sprite.switchPalette(palette)
+            if not isinstance(sprite, spr.LazySprite) or sprite.isDecoded():
+                sprite.compact()
 
     def changeRemap(self, color, remap):
         if color:
@@ -241,8 +281,11 @@ class RCTObject:
 
 
 class SmallScenery(RCTObject):
+    RENDER_CACHE_SIZE = 32
+
     def __init__(self, data: dict, sprites: dict, old_id=None):
         super().__init__(data, sprites, old_id)
+        self.render_cache = OrderedDict()
         if data:
             if data['objectType'] != 'scenery_small':
                 raise TypeError("Object is not small scenery.")
@@ -354,14 +397,51 @@ class SmallScenery(RCTObject):
             im['y'] = sprite.y + offset
 
     def show(self, rotation=None, animation_frame: int = 0, wither: int = 0, glass: bool = True):
-        """Still need to implement all possible animation cases and glass objects."""
+        """Renders the view as (image, x, y). Renders are cached by the view, the remaps and the
+        versions and offsets of the sprites used, so only views whose sprites changed are
+        rendered again. The returned image must not be modified."""
+        if isinstance(rotation, int):
+            rotation = rotation % 4
+        else:
+            rotation = self.rotation
+
+        sprites = self.showSprites(rotation, animation_frame, wither, glass)
+        key = (self.subtype, getattr(self, 'animation_type', None), rotation, animation_frame, wither, glass,
+               self.current_first_remap, self.current_second_remap, self.current_third_remap,
+               tuple((sprite.version, sprite.x, sprite.y) for sprite in sprites))
+
+        render = self.render_cache.get(key)
+        if render is not None:
+            self.render_cache.move_to_end(key)
+            return render
+
+        render = self._render(rotation, animation_frame, wither, glass)
 
+        self.render_cache[key] = render
+        if len(self.render_cache) > self.RENDER_CACHE_SIZE:
+            self.render_cache.popitem(last=False)
+
+        return render
+
+    def showSprites(self, rotation: int, animation_frame: int = 0, wither: int = 0, glass: bool = True):
+        """Gives the sprites that make up the rendered view."""
         if self.subtype == self.Subtype.GLASS and glass:
-            if isinstance(rotation, int):
-                rotation = rotation % 4
-            else:
-                rotation = self.rotation
+            indices = [rotation, rotation+4]
+        elif self.subtype == self.Subtype.ANIMATED and self.animation_type in [self.AnimationType.FOUNTAIN1, self.AnimationType.FOUNTAIN4]:
+            fountain_index = rotation+4*(animation_frame+1)
+            fountain_index += 4 if self.animation_type == self.AnimationType.FOUNTAIN4 else 0
+            indices = [rotation, fountain_index]
+            if self.animation_type == self.AnimationType.FOUNTAIN4:
+                indices += [rotation+4, fountain_index+16]
+        else:
+            indices = [self.giveIndex(rotation, animation_frame, wither)]
 
+        return [self.sprites[self.data['images'][index]['path']] for index in indices]
+
+    def _render(self, rotation: int, animation_frame: int = 0, wither: int = 0, glass: bool = True):
+        """Still need to implement all possible animation cases and glass objects."""
+
+        if self.subtype == self.Subtype.GLASS and glass:
             sprite_index = rotation
             mask_index = rotation+4
             sprite = self.sprites[self.data['images'][sprite_index]['path']]
@@ -411,11 +491,6 @@ class SmallScenery(RCTObject):
 
             return canvas, x, y
         elif self.subtype == self.Subtype.ANIMATED and self.animation_type in [self.AnimationType.FOUNTAIN1, self.AnimationType.FOUNTAIN4]:
-            if isinstance(rotation, int):
-                rotation = rotation % 4
-            else:
-                rotation = self.rotation
-
             base_index = rotation
             fountain_index = rotation+4*(animation_frame+1)
             fountain_index += 4 if self.animation_type == self.AnimationType.FOUNTAIN4 else 0
@@ -909,18 +984,69 @@ class LargeScenery(RCTObject):
             return self.value
 
 
+def _zipMember(path: str):
+    """Gives the name of the archive member at the relative path given in an object's json."""
+    return normpath(path.replace('\\', '/'))
+
+
+def _zipInfo(member: str, compression: int):
+    """Gives the archive entry of member with a fixed timestamp, so that saving the same object
+    twice gives the same file."""
+    info = ZipInfo(member, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = compression
+    info.external_attr = 0o644 << 16
+
+    return info
+
+
+def _mapThreads(function, items: list, workers: int = None):
+    """Gives the list of function applied to items, computed on a pool of workers threads (by
+    default LOAD_WORKERS). All workers parameters of this module end up here."""
+    # Threads and not processes: sprites refer to the shared module palettes, which are compared
+    # by identity, and pickling the images would cost more than the work itself. numpy, zlib
+    # and PIL release the GIL for the heavy parts.
+    workers = workers or LOAD_WORKERS or cpu_count() or 1
+
+    if workers == 1 or len(items) < 2:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+
+def _loadSprites(files: list, workers: int = None):
+    """Decodes the images of the (path or file object, coords) pairs in files into sprites named images/i.png."""
+    def loadSprite(file):
+        path, coords = file
+        return spr.Sprite.fromFile(path, coords=coords)
+
+    sprites = _mapThreads(loadSprite, files, workers)
+
+    return {f'images/{i}.png': sprite for i, sprite in enumerate(sprites)}
+
+
+def switchPalettes(objects: list, palette, workers: int = None):
+    """Switches all sprites of the objects to palette, sharing them out over one pool of threads."""
+    for obj in objects:
+        obj.palette = palette
+
+    sprites = [sprite for obj in objects for sprite in obj.sprites.values()]
+    _mapThreads(lambda sprite: sprite.switchPalette(palette), sprites, workers)
+
+
 # Wrapper to load any object type and instantiate is as the correct subclass
 
-def load(filepath: str, openpath=OPENRCTPATH):
-    """Instantiates a new object from a .parkobj  or .dat file."""
+def load(filepath: str, openpath=OPENRCTPATH, lazy: bool = False, workers: int = None):
+    """Instantiates a new object from a .parkobj  or .dat file. lazy only affects .dat files,
+    their sprites are then decoded on first access (e.g. for metadata scans)."""
     extension = splitext(filepath)[1].lower()
 
     if extension == '.parkobj':
-        obj = RCTObject.fromParkobj(filepath, openpath)
+        obj = RCTObject.fromParkobj(filepath, openpath, workers)
     elif extension == '.dat':
-        obj = RCTObject.fromDat(filepath)
+        obj = RCTObject.fromDat(filepath, lazy)
     elif extension == '.json':
-        obj = RCTObject.fromJson(filepath, openpath)
+        obj = RCTObject.fromJson(filepath, openpath, workers)
     else:
         raise RuntimeError("Unsupported object file type.")
 
@@ -934,14 +1060,22 @@ def load(filepath: str, openpath=OPENRCTPATH):
             f"Object type {obj_type} unsupported by now.")
 
 
-def loadFromId(identifier: str, openpath=OPENRCTPATH):
+def loadFromId(identifier: str, openpath=OPENRCTPATH, lazy: bool = False, index=None):
+    """Loads a DAT object from the OpenRCT2 object folder. If it does not lie directly in the folder,
+    it is looked up in the given objectindex.ObjectIndex (e.g. for objects in subfolders). The index
+    is not rescanned here, objects added since its last update are not found."""
     filepath = f'{openpath}/object/{identifier}.DAT'
 
+    if not exists(filepath) and index is not None:
+        entry = index.get(identifier)
+        if entry:
+            filepath = entry['path']
+
     if not exists(filepath):
         raise RuntimeError(f'Could not find DAT-object in specified OpenRCT2 path: \n \
                            "{filepath}"')
 
-    obj = RCTObject.fromDat(filepath)
+    obj = RCTObject.fromDat(filepath, lazy)
 
     obj_type = obj.data.get("objectType", False)
     if obj_type == 'scenery_small':
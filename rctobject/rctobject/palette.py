@@ -11,6 +11,13 @@ import numpy as np
 from PIL import Image
 from io import BytesIO
 from pkgutil import get_data
+from types import MappingProxyType
+from collections import OrderedDict
+from threading import Lock, RLock
+
+# the lazy tables of the palettes are built once, also when they are first needed by several
+# worker threads at the same time
+_tables_lock = RLock()
 
 
 class Palette(np.ndarray):
@@ -47,123 +54,238 @@ class Palette(np.ndarray):
     #     return str(self.name)
 
     def getColor(self, color: str):
+        """Returns the (12,3) array of the shades of a color, None if it is not in the palette."""
+        return self._colorTables()[0].get(color)
+
+    def getRemapColor(self, color_name: str):
+        """Returns the (12,3) array of the shades of a remap color (see remapColors)."""
+        return self._colorTables()[1][color_name]
+
+    def indexColor(self, index: int):
+        """Returns the (color name, shade) of a palette index, None for 255 and unused indices."""
+        return self._colorTables()[2][index]
+
+    def colorIndex(self, color):
+        """Returns the palette index of an RGB color, 255 if it is not in the palette."""
+        return self._colorTables()[3].get(tuple(int(c) for c in color[:3]), 255)
+
+    def _colorTables(self):
+        # Built once per palette: shades by color name (with the aliases Pink and Yellow), shades by
+        # remap color name, the color and shade of each index and the index of each RGB color.
+        # The arrays are read-only as they are shared by all callers.
+        tables = getattr(self, '_tables', None)
+        if tables is not None:
+            return tables
+
+        with _tables_lock:
+            if getattr(self, '_tables', None) is None:
+                self._tables = self._buildColorTables()
+
+        return self._tables
+
+    def _buildColorTables(self):
+        colors = {}
+        for color, row in self.color_dict.items():
+            if color != 'Sparkles' and 0 <= row < self.shape[0]:
+                colors[color] = _readOnly(np.array(self[row]))
+        if self.has_sparkles:
+            colors['Sparkles'] = _readOnly(np.array(self.sparkles))
+        for alias, color in [('Pink', '2nd Remap'), ('Yellow', '3rd Remap')]:
+            colors.pop(alias, None)
+            if color in colors:
+                colors[alias] = colors[color]
+
+        remap_colors = {}
+        for color_name, i in remapColors().items():
+            lookup = remap_lookup[i].astype(int)
+            # palettes with fewer colors (save_colors) lack some remap colors
+            if lookup[:, 0].max() < self.shape[0]:
+                remap_colors[color_name] = _readOnly(
+                    np.array(self)[lookup[:, 0], lookup[:, 1]])
+        remap_colors['1st Remap'] = colors.get('1st Remap')
+
+        index_colors = [None]*256
+        for color, row in self.color_dict.items():
+            if color != 'Sparkles' and 0 <= row < self.shape[0]:
+                for shade in range(12):
+                    index_colors[12*row + shade] = (color, shade)
+        if self.has_sparkles:
+            for shade in range(12):
+                index_colors[12*self.shape[0] + shade] = ('Sparkles', shade)
+
+        color_index = {}
+        for color, index in zip(self.flatColors().tolist(), self._indexKeys()[2].tolist()):
+            color_index.setdefault(tuple(color), index)
+
+        return (colors, remap_colors, tuple(index_colors), color_index)
+
+    def arr(self):
+        return np.array(self)
+
+    # Palette indices: shade s of the color in row c has index 12*c+s, the sparkles follow after
+    # the last color. Colors occuring several times share the index of their first occurence,
+    # pixels that are not in the palette get the index 255.
+
+    def flatColors(self):
+        """Returns all colors of the palette as (N,3) array in index order."""
+        colors = np.array(self).reshape(-1, 3)
+        if self.has_sparkles:
+            colors = np.concatenate((colors, np.array(self.sparkles)))
+
+        return colors
+
+    def toIndices(self, data: np.ndarray):
+        """Converts an RGB(A) pixel array to an uint8 array of palette indices."""
+        keys, canonical, _ = self._indexKeys()
+
+        packed = (data[..., 0].astype(np.uint32) << 16) | (
+            data[..., 1].astype(np.uint32) << 8) | data[..., 2]
+        pos = np.searchsorted(keys, packed)
+        pos[pos == len(keys)] = 0
+
+        return np.where(keys[pos] == packed, canonical[pos], 255).astype(np.uint8)
+
+    def colorIndices(self, color: str):
+        """Returns the 12 palette indices of the shades of a color, None if the color is not in the palette."""
         if color == 'Pink':
             color = '2nd Remap'
         elif color == 'Yellow':
             color = '3rd Remap'
 
         if color != 'Sparkles':
-            i = self.color_dict.get(color, -1)
-            if i > -1:
-                return self.__getitem__(i)
+            row = self.color_dict.get(color, -1)
+            if row < 0 or row >= self.shape[0]:
+                return None
         elif self.has_sparkles:
-            return self.sparkles
+            row = self.shape[0]
+        else:
+            return None
 
-        return None
+        return self._indexKeys()[2][12*row:12*row+12]
 
-    def getRemapColor(self, color_name: str):
-        if color_name == '1st Remap':
-            return self.getColor(color_name)
+    def _indexKeys(self):
+        # sorted packed colors with their canonical index, and the canonical index of each index
+        index_keys = getattr(self, '_index_keys', None)
+        if index_keys is not None:
+            return index_keys
 
-        color = np.zeros((12, 3), dtype='uint8')
+        with _tables_lock:
+            if getattr(self, '_index_keys', None) is None:
+                colors = self.flatColors().astype(np.uint32)
+                packed = (colors[:, 0] << 16) | (
+                    colors[:, 1] << 8) | colors[:, 2]
 
-        lookup = remap_lookup[remapColors()[color_name]]
+                # first occurence of each color
+                _, first, inverse = np.unique(
+                    packed, return_index=True, return_inverse=True)
+                canonical = first[inverse].astype(np.uint8)
 
-        for i in range(12):
-            color[i] = self[int(lookup[i][0]), int(lookup[i][1])]
+                order = np.argsort(packed, kind='stable')
+                self._index_keys = (
+                    packed[order], canonical[order], canonical)
 
-        return color
+        return self._index_keys
 
-    def arr(self):
-        return np.array(self)
+
+# The color names are shared by all palettes and must not be changed.
+
+_ALL_COLORS = MappingProxyType({
+    'Grey': 0,
+    'Dark Olive': 1,
+    'Light Brown': 2,
+    '3rd Remap': 3,
+    'Bordeaux': 4,
+    'Grass Green': 5,
+    'Light Olive': 6,
+    'Green': 7,
+    'Tan': 8,
+    'Indigo': 9,
+    'Blue': 10,
+    'Sea Green': 11,
+    'Purple': 12,
+    'Red': 13,
+    'Orange': 14,
+    'Teal': 15,
+    '2nd Remap': 16,
+    'Brown': 17,
+    '1st Remap': 18
+})
+
+_ALL_COLORS_SPARKLES = MappingProxyType({
+    'Grey': 0,
+    'Dark Olive': 1,
+    'Light Brown': 2,
+    '3rd Remap': 3,
+    'Bordeaux': 4,
+    'Grass Green': 5,
+    'Light Olive': 6,
+    'Green': 7,
+    'Tan': 8,
+    'Indigo': 9,
+    'Blue': 10,
+    'Sea Green': 11,
+    'Purple': 12,
+    'Red': 13,
+    'Orange': 14,
+    'Teal': 15,
+    '2nd Remap': 16,
+    'Brown': 17,
+    '1st Remap': 18,
+    'Sparkles': 19
+})
+
+_REMAP_COLORS = MappingProxyType({
+    'NoColor': -1,
+
+    'Black': 0,
+    'Grey': 1,
+    'White': 2,
+    'Dark Purple': 3,
+    'Light Purple': 4,
+    'Bright Purple': 5,
+    'Dark Blue': 6,
+    'Light Blue': 7,
+
+    'Icy Blue': 8,
+    'Dark Water': 9,
+    'Light Water': 10,
+    'Saturated Green': 11,
+    'Dark Green': 12,
+    'Moss Green': 13,
+    'Bright Green': 14,
+    'Olive Green': 15,
+
+    'Dark Olive Green': 16,
+    'Bright Yellow': 17,
+    'Yellow': 18,
+    'Dark Yellow': 19,
+    'Light Orange': 20,
+    'Dark Orange': 21,
+    'Light Brown': 22,
+    'Saturated Brown': 23,
+
+    'Dark Brown': 24,
+    'Salmon Pink': 25,
+    'Bordeaux Red': 26,
+    'Saturated Red': 27,
+    'Bright Red': 28,
+    'Dark Pink': 29,
+    'Light Pink': 30,
+    'Bright Pink': 31
+})
 
 
 def allColors(sparkles=False):
-    if not sparkles:
-        return {
-            'Grey': 0,
-            'Dark Olive': 1,
-            'Light Brown': 2,
-            '3rd Remap': 3,
-            'Bordeaux': 4,
-            'Grass Green': 5,
-            'Light Olive': 6,
-            'Green': 7,
-            'Tan': 8,
-            'Indigo': 9,
-            'Blue': 10,
-            'Sea Green': 11,
-            'Purple': 12,
-            'Red': 13,
-            'Orange': 14,
-            'Teal': 15,
-            '2nd Remap': 16,
-            'Brown': 17,
-            '1st Remap': 18
-        }
-    else:
-        return {
-            'Grey': 0,
-            'Dark Olive': 1,
-            'Light Brown': 2,
-            '3rd Remap': 3,
-            'Bordeaux': 4,
-            'Grass Green': 5,
-            'Light Olive': 6,
-            'Green': 7,
-            'Tan': 8,
-            'Indigo': 9,
-            'Blue': 10,
-            'Sea Green': 11,
-            'Purple': 12,
-            'Red': 13,
-            'Orange': 14,
-            'Teal': 15,
-            '2nd Remap': 16,
-            'Brown': 17,
-            '1st Remap': 18,
-            'Sparkles': 19
-        }
+    return _ALL_COLORS_SPARKLES if sparkles else _ALL_COLORS
 
 
 def remapColors():
-    return {'NoColor': -1,
-
-            'Black': 0,
-            'Grey': 1,
-            'White': 2,
-            'Dark Purple': 3,
-            'Light Purple': 4,
-            'Bright Purple': 5,
-            'Dark Blue': 6,
-            'Light Blue': 7,
-
-            'Icy Blue': 8,
-            'Dark Water': 9,
-            'Light Water': 10,
-            'Saturated Green': 11,
-            'Dark Green': 12,
-            'Moss Green': 13,
-            'Bright Green': 14,
-            'Olive Green': 15,
-
-            'Dark Olive Green': 16,
-            'Bright Yellow': 17,
-            'Yellow': 18,
-            'Dark Yellow': 19,
-            'Light Orange': 20,
-            'Dark Orange': 21,
-            'Light Brown': 22,
-            'Saturated Brown': 23,
-
-            'Dark Brown': 24,
-            'Salmon Pink': 25,
-            'Bordeaux Red': 26,
-            'Saturated Red': 27,
-            'Bright Red': 28,
-            'Dark Pink': 29,
-            'Light Pink': 30,
-            'Bright Pink': 31}
+    return _REMAP_COLORS
+
+
+def _readOnly(array: np.ndarray):
+    array.setflags(write=False)
+    return array
 
 
 remap_lookup = np.load(
@@ -204,30 +326,60 @@ def switchPalette(image: Image.Image, pal_in: Palette, pal_out: Palette, include
            pal_in;   palette in (20,12,3) shape from which you want to convert
            pal_out;  palette in (20,12,3) shape to which you want to convert
     """
-
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
     if include_sparkles and not (pal_in.has_sparkles and pal_out.has_sparkles):
         raise ValueError(
             'Asked to include sparkles but one of given palette has no sparkles.')
 
-    colors = allColors(include_sparkles).keys()
+    keys, values = _switchTable(pal_in, pal_out, include_sparkles)
+
+    data = np.array(image)
+    packed = _packColors(data[..., :3])
+
+    pos = np.searchsorted(keys, packed)
+    pos[pos == len(keys)] = 0
+    hit = keys[pos] == packed
+
+    data[..., :3][hit] = _unpackColors(values[pos[hit]])
+
+    return Image.fromarray(data)
+
+
+SWITCH_CACHE_SIZE = 16
+_switch_tables = OrderedDict()
+_switch_tables_lock = Lock()
+
+
+def _switchTable(pal_in: Palette, pal_out: Palette, include_sparkles: bool):
+    """Gives the sorted packed colors of pal_in with the packed colors of pal_out they turn into.
+    Every shade of every color is replaced by the same shade in pal_out, if a color occurs
+    several times in pal_in the last occurence decides."""
+    key = (pal_in.name, pal_out.name, include_sparkles)
 
-    for colorname in colors:
+    with _switch_tables_lock:
+        table = _switch_tables.get(key)
+        if table is not None:
+            _switch_tables.move_to_end(key)
+            return table
+
+    translation = {}
+    for colorname in allColors(include_sparkles):
         color_old = pal_in.getColor(colorname)
         color_new = pal_out.getColor(colorname)
 
-        for i in range(12):
+        translation.update(
+            zip(_packColors(color_old).tolist(), _packColors(color_new).tolist()))
+
+    keys = np.array(sorted(translation), dtype=np.uint32)
+    values = np.array([translation[k] for k in keys.tolist()], dtype=np.uint32)
+    table = (_readOnly(keys), _readOnly(values))
+
+    with _switch_tables_lock:
+        _switch_tables[key] = table
+        if len(_switch_tables) > SWITCH_CACHE_SIZE:
+            _switch_tables.popitem(last=False)
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
+    return table
 
-    return Image.fromarray(data_out)
 
 # def generatePalette(image):
 
@@ -237,27 +389,129 @@ def addPalette(image, palette: Palette = orct, dither=True, transparent_color=(0
     if not transparent_color:
         transparent_color = image.getpixel((0, 0))[:3]
 
-    mask = alphaMask(image, transparent_color)
-    image = image.convert('RGB')
-
-    if include_sparkles and palette.has_sparkles:
-        palette = np.concatenate(
-            (np.array(palette), np.array([palette.sparkles])))
-    elif include_sparkles:
+    if include_sparkles and not palette.has_sparkles:
         raise TypeError(
             'Asked to include sparkles but given palette has no sparkles.')
 
-    pal_in = np.array(palette)
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    return Image.fromarray(quantize(np.asarray(image), palette, transparent_color, dither, include_sparkles), 'RGBA')
+
+
+# Quantization to a palette. The candidates are the colors of the palette and black, which was
+# the padding of the 256 color palette given to PIL. Without dithering each pixel gets the nearest
+# candidate in RGB, looked up in a table over all 2^24 colors that is filled as colors come up.
+# Floyd-Steinberg dithering is left to PIL's C implementation, unless all pixels already have
+# candidate colors, as there is no error to spread then. Pixels are handled as uint32 RGBA words.
+#
+# The table takes 16 MB and is made once per palette and sparkles mode, when the first image is
+# quantized, so at most a few of them exist. Worker threads may fill it at the same time, they
+# only ever write the same nearest candidate for a color.
+
+def quantize(data: np.ndarray, palette: Palette, transparent_color=(0, 0, 0), dither: bool = True,
+             include_sparkles: bool = False):
+    """Gives the RGBA array data with every pixel replaced by the nearest color of palette, with
+    Floyd-Steinberg dithering if dither is set. Pixels of transparent_color or with alpha 0 become
+    transparent."""
+    candidates, table = _quantizeTable(palette, include_sparkles)
+
+    words = np.ascontiguousarray(data, dtype=np.uint8).view('<u4')[:, :, 0]
+    packed = words & 0xFFFFFF
+    mask = (packed == _packColors(np.array(transparent_color, dtype=np.uint8))) | (words >> 24 == 0)
+
+    nearest = table[packed]
+
+    if dither:
+        # colors that were not looked up yet are no candidates, clipping keeps them unequal
+        out = candidates.take(nearest, mode='clip')
+        exact = (out & 0xFFFFFF) == packed
+        if not (exact | mask).all():
+            out = _quantizePil(data, candidates, dither)
+    else:
+        unknown = nearest == 255
+        if unknown.any():
+            colors = np.unique(packed[unknown])
+            table[colors] = _nearestCandidates(
+                _unpackColors(colors), candidates)
+            nearest[unknown] = table[packed[unknown]]
+
+        out = candidates[nearest]
+
+    out[mask] = 0
+
+    return out.view(np.uint8).reshape(data.shape)
+
+
+def _quantizeTable(palette: Palette, include_sparkles: bool):
+    key = '_quantize_sparkles' if include_sparkles else '_quantize'
+    quantize_table = getattr(palette, key, None)
+    if quantize_table is not None:
+        return quantize_table
+
+    with _tables_lock:
+        quantize_table = getattr(palette, key, None)
+        if quantize_table is None:
+            quantize_table = _buildQuantizeTable(palette, include_sparkles)
+            setattr(palette, key, quantize_table)
+
+    return quantize_table
+
+
+def _buildQuantizeTable(palette: Palette, include_sparkles: bool):
+    colors = np.array(palette).reshape(-1, 3)
+    if include_sparkles:
+        colors = np.concatenate((colors, np.array(palette.sparkles)))
+
+    colors = np.concatenate(
+        (np.zeros((1, 3), dtype=np.uint8), colors.astype(np.uint8)))
+    candidates = _packColors(colors) | np.uint32(0xFF000000)
+    candidates.setflags(write=False)
+
+    # 255 marks colors whose nearest candidate was not looked up yet
+    table = np.full(1 << 24, 255, dtype=np.uint8)
+    table[_packColors(colors)[::-1]] = np.arange(len(colors))[::-1]
+
+    return candidates, table
+
+
+def _nearestCandidates(colors: np.ndarray, candidates: np.ndarray, chunk: int = 4096):
+    """Gives for each RGB color the index of the nearest candidate. On equal distance the first
+    candidate wins."""
+    colors = np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+    cand = _unpackColors(candidates).astype(np.float32)
+    cand_norm = (cand**2).sum(axis=1)
+
+    nearest = np.empty(len(colors), dtype=np.uint8)
+    for start in range(0, len(colors), chunk):
+        part = colors[start:start+chunk]
+        # |c - p|^2 without the |c|^2 term, which is the same for all candidates
+        distance = cand_norm[np.newaxis, :] - 2*part @ cand.T
+        nearest[start:start+chunk] = distance.argmin(axis=1)
+
+    return nearest
+
+
+def _quantizePil(data: np.ndarray, candidates: np.ndarray, dither: bool):
+    pal_in = np.zeros((256, 3), dtype=np.uint8)
+    pal_in[256-len(candidates)+1:] = _unpackColors(candidates[1:])
 
-    pal_in = pal_in.reshape(-1, pal_in.shape[-1])
-    pal_in = np.append(np.zeros((256-len(pal_in), 3)), pal_in, axis=0)
-    pal_in = np.uint8(pal_in.flatten()).tolist()
     p = Image.new("P", (1, 1))
-    p.putpalette(pal_in)
-    image = image.quantize(method=3, palette=p,
-                           dither=int(dither)).convert('RGBA')
+    p.putpalette(pal_in.flatten().tolist())
+    image = Image.fromarray(np.ascontiguousarray(data, dtype=np.uint8), 'RGBA').convert('RGB')
+    image = image.quantize(method=3, palette=p, dither=int(dither)).convert('RGBA')
+
+    return np.array(image).view('<u4')[:, :, 0]
+
 
-    return removeColorOnMask(image, mask)
+def _packColors(colors: np.ndarray):
+    """Packs RGB colors into the lower three bytes of little endian RGBA words."""
+    colors = colors.astype(np.uint32)
+    return colors[..., 0] | (colors[..., 1] << 8) | (colors[..., 2] << 16)
+
+
+def _unpackColors(packed: np.ndarray):
+    return np.stack((packed & 255, (packed >> 8) & 255, (packed >> 16) & 255), axis=-1).astype(np.uint8)
 
 
 def alphaToColor(image: Image.Image, color=(0, 0, 0)):
@@ -291,41 +545,6 @@ def colorAllVisiblePixels(image: Image.Image, color):
     return Image.fromarray(x, 'RGBA')
 
 
-def alphaMask(image: Image.Image, color=(0, 0, 0), alpha_threshold = 0):
-    data_in = np.array(image)
-    r1, g1, b1 = color
-
-    red, green, blue, alpha = data_in[:, :, 0], data_in[:,
-                                                        :, 1], data_in[:, :, 2], data_in[:, :, 3]
-    mask = ((red == r1) & (green == g1) & (blue == b1)) | (alpha <= alpha_threshold)
-
-    return mask
-
-
-def removeColorWhenImport(image: Image.Image, color=(0, 0, 0)):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
-    if color:
-        r1, g1, b1 = color
-    else:
-        r1, g1, b1 = data_in[0, 0][:3]
-
-    red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-    mask = (red == r1) & (green == g1) & (blue == b1)
-    data_out[:, :, :][mask] = [0, 0, 0, 0]
-
-    return Image.fromarray(data_out)
-
-
-def removeColorOnMask(image: Image.Image, mask: np.array):
-    data = np.array(image)
-
-    data[:, :, :][mask] = [0, 0, 0, 0]
-
-    return Image.fromarray(data)
-
-
 complete_palette_array = np.zeros((256, 3), dtype=int)
 
 complete_palette_array[0] = np.array([0, 0, 0])
@@ -584,3 +803,7 @@ complete_palette_array[252] = np.array([255, 155, 51])
 complete_palette_array[253] = np.array([255, 183, 63])
 complete_palette_array[254] = np.array([255, 207, 75])
 complete_palette_array[255] = np.array([0, 0, 0])
+
+# RGBA version of the complete palette, used to convert palette index arrays with a single lookup
+complete_palette_rgba = np.full((256, 4), 255, dtype=np.uint8)
+complete_palette_rgba[:, :3] = complete_palette_array
@@ -10,57 +10,182 @@
 import numpy as np
 from PIL import Image
 from copy import copy
+from io import BytesIO
+from collections import OrderedDict
+from itertools import count
+from threading import Lock
 import rctobject.palette as pal
 
+# Every image a sprite is given gets a new version number, unique across all sprites, so that
+# renders built from sprites can be cached by the versions of the sprites they used.
+_versions = count()
+
 
 class Sprite:
     def __init__(self, image: Image.Image, coords: tuple = None, palette: pal.Palette = pal.orct, dither: bool = True,
                  transparent_color: tuple = (0, 0, 0)):
 
         if image:
-            image = pal.addPalette(image, palette, dither, transparent_color)
-
-            bbox = image.getbbox()
-            image = image.crop(bbox)
-
+            image = _prepareImage(image, palette, dither, transparent_color)
         else:
             image = Image.new('RGBA', (1, 1))
 
-        self.image = image
-        self.image_base = image
-        if coords:
-            self.x, self.y = coords
-            self.x_base, self.y_base = coords
-        else:
-            self.x = -int(image.size[0]/2)
-            self.y = -int(image.size[1])
-            self.x_base = int(self.x)
-            self.y_base = int(self.y)
+        if not coords:
+            coords = (-int(image.size[0]/2), -int(image.size[1]))
+
+        self._setState(image, coords, palette)
+
+    def _setState(self, image: Image.Image, coords: tuple, palette: pal.Palette):
+        # state shared by all sprites, image may be None for sprites that are decoded later
+        self._image = image
+        self._indices = None
+        self._image_base = image
+        self._indices_base = None
+        self.version = next(_versions)
+        self._png = None
+        self._census = None
+
+        self.x, self.y = coords
+        self.x_base, self.y_base = coords
 
         self.palette = palette
 
+    # The image and the base image are either held as RGBA image or, after compact(), as array
+    # of palette indices (see Palette.toIndices) with 255 marking transparent pixels. The RGBA
+    # image is then rebuilt from the indices on access and only kept in the shared cache of
+    # recently decoded images (see _decodedImage), not by the sprite.
+
+    @property
+    def image(self):
+        if self._image is None:
+            if self._indices is self._indices_base and self._image_base is not None:
+                return self._image_base
+            return _decodedImage(self._indices, self.palette)
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self._indices = None
+        self.version = next(_versions)
+
+    @property
+    def image_base(self):
+        if self._image_base is None:
+            if self._indices_base is self._indices and self._image is not None:
+                return self._image
+            return _decodedImage(self._indices_base, self.palette)
+        return self._image_base
+
+    @image_base.setter
+    def image_base(self, image):
+        self._image_base = image
+        self._indices_base = None
+
     @classmethod
     def fromFile(cls, path: str, coords: tuple = None, palette: pal.Palette = pal.orct, dither: bool = True,
                  transparent_color: tuple = (0, 0, 0)):
-        """Instantiates a new Sprite from an image file."""
-        image = Image.open(path).convert('RGBA')
-        return cls(
+        """Instantiates a new Sprite from an image file, path may also be a file object. If the file
+        already shows the sprite as it is in the orct palette, it is kept as encoding of the sprite."""
+        if isinstance(path, str):
+            with open(path, mode='rb') as file:
+                png = file.read()
+        else:
+            png = path.read()
+
+        image = Image.open(BytesIO(png)).convert('RGBA')
+        sprite = cls(
             image=image, coords=coords, palette=palette, dither=dither, transparent_color=transparent_color)
 
+        if palette is pal.orct and sprite.image.size == image.size and \
+                np.array_equal(np.asarray(sprite.image), np.asarray(image)):
+            sprite._png = ((sprite.version, palette.name), png)
+
+        return sprite
+
     def save(self, path: str, keep_palette: bool = False):
         # Sprites should always be saved in the orct palette so that they can be read properly by the game
         if not keep_palette and self.palette is not pal.orct:
             self.switchPalette(pal.orct)
         self.image.save(path)
 
+    def encodePng(self):
+        """Gives the image in the orct palette as PNG file. The bytes are kept until the image
+        changes, so saving an unchanged sprite again does not encode it again."""
+        key = (self.version, self.palette.name)
+        if self._png is None or self._png[0] != key:
+            image = self.image
+            if self.palette is not pal.orct:
+                image = pal.switchPalette(image, self.palette, pal.orct)
+
+            buffer = BytesIO()
+            image.save(buffer, 'PNG')
+            self._png = (key, buffer.getvalue())
+
+        return self._png[1]
+
     def show(self, first_remap: str = 'NoColor', second_remap: str = 'NoColor', third_remap: str = 'NoColor'):
-        return colorRemaps(self.image, first_remap, second_remap, third_remap)
+        if first_remap == second_remap == third_remap == 'NoColor':
+            return self.image
+
+        # remaps are shown in the orct palette, the cached indices can only be used if they match
+        if self.palette is not pal.orct:
+            return colorRemaps(self.image, first_remap, second_remap, third_remap)
+
+        lut, changed = _remapLut(
+            pal.orct, first_remap, second_remap, third_remap)
+        indices = self.giveIndices()
+        mask = changed[indices]
+
+        data = np.array(self.image)
+        data[mask, :3] = lut[indices[mask]]
+
+        return Image.fromarray(data)
 
     def giveProtectedPixelMask(self, color: str or list):
-        return protectColorMask(self.image, color, self.palette)
+        if isinstance(color, str):
+            color = [color]
+
+        selected = _colorSelection(
+            self.palette, [color_name for color_name in color if color_name in self.palette.color_dict])
+
+        return Image.fromarray(selected[self.giveIndices()])
+
+    def giveIndices(self):
+        """Returns the palette indices of the image, 255 for transparent pixels and colors
+        that are not in the palette. The array is cached until the image changes."""
+        if self._indices is None:
+            if self._image is self._image_base and self._indices_base is not None:
+                self._indices = self._indices_base
+            else:
+                self._indices = _indicesFromImage(self.image, self.palette)
+        return self._indices
+
+    def compact(self):
+        """Drops the RGBA images and keeps only their palette indices, which need a fourth of
+        the memory. Returns False and changes nothing if an image has semi-transparent pixels
+        or colors that are not in the palette."""
+        indices = _indicesFromImage(self.image, self.palette, strict=True)
+        if indices is None:
+            return False
+
+        if self.image_base is self.image:
+            indices_base = indices
+        else:
+            indices_base = _indicesFromImage(
+                self.image_base, self.palette, strict=True)
+            if indices_base is None:
+                return False
+
+        self._image, self._indices = None, indices
+        self._image_base, self._indices_base = None, indices_base
+
+        return True
 
     def resetSprite(self):
-        self.image = self.image_base
+        self._image = self._image_base
+        self._indices = self._indices_base
+        self.version = next(_versions)
         self.resetOffsets()
 
     def clearSprite(self):
@@ -85,20 +210,51 @@ class Sprite:
         self.y_base = y
 
     def checkPrimaryColor(self):
-        return checkPrimaryColor(self.image, self.palette)
+        return self.checkColor('1st Remap')
 
     def checkSecondaryColor(self):
-        return checkSecondaryColor(self.image, self.palette)
+        return self.checkColor('2nd Remap')
 
     def checkTertiaryColor(self):
-        return checkTertiaryColor(self.image, self.palette)
+        return self.checkColor('3rd Remap')
 
     def checkColor(self, color_name: str):
-        return checkColor(self.image, color_name, self.palette)
+        return bool(self.colorCensus()[_colorSelection(self.palette, color_name)].any())
+
+    def colorCensus(self):
+        """Returns the number of pixels of each palette index in the image, the last entry
+        (index 255) counts transparent pixels and colors that are not in the palette. The
+        counts are kept until the image changes."""
+        key = (self.version, self.palette.name)
+        if self._census is None or self._census[0] != key:
+            census = np.bincount(self.giveIndices().ravel(), minlength=256)
+            census.setflags(write=False)
+            self._census = (key, census)
+
+        return self._census[1]
+
+    def colorsPresent(self):
+        """Returns a dict of the colors in the image with the pixel count of each of their
+        12 shades."""
+        census = self.colorCensus()
+        colors = {}
+        for color_name in list(self.palette.color_dict) + ['Sparkles']:
+            indices = self.palette.colorIndices(color_name)
+            if indices is not None and census[indices].any():
+                colors[color_name] = census[indices]
+
+        return colors
 
     def switchPalette(self, palette_new: pal.Palette, include_sparkles=True):
+        # the base image keeps its colors, so it must not be rebuilt in the new palette
+        self.image_base = self.image_base
+        png, key = self._png, (self.version, self.palette.name)
         self.image = pal.switchPalette(
             self.image, self.palette, palette_new, include_sparkles)
+
+        # shades are mapped one to one, so the sprite still encodes to the same file
+        if png is not None and include_sparkles and png[0] == key:
+            self._png = ((self.version, palette_new.name), png[1])
         self.palette = palette_new
 
     def changeBrightness(self, step: int, include_sparkles: bool = False):
@@ -120,6 +276,33 @@ class Sprite:
     def colorAllInRemap(self, color_name: str):
         self.image = colorAllInRemap(self.image, color_name,  self.palette)
 
+    def colorOperations(self, operations: list):
+        """Applies the color operations in order (see colorIndexLut). Images that consist of
+        palette colors only are changed with one lookup over their indices, others go through
+        the single operations."""
+        data = np.asarray(self.image)
+        indices = self.giveIndices()
+        alpha = data[:, :, 3]
+        visible = alpha != 0
+
+        if (alpha[visible] == 255).all() and (indices[visible] != 255).all() and \
+                not data[~visible].any():
+            indices_new = colorIndexLut(self.palette, operations)[indices]
+            if not np.array_equal(indices_new, indices):
+                self.image = _imageFromIndices(indices_new, self.palette)
+                self._indices = indices_new
+        else:
+            for operation, color, value in operations:
+                if operation == 'remap':
+                    self.remapColor(color, value)
+                elif operation == 'brightness':
+                    self.changeBrightnessColor(value, color)
+                elif operation == 'remove':
+                    self.image = removeColor(self.image, color, self.palette)
+
+        if any(operation == 'remove' for operation, _, _ in operations):
+            self.crop()
+
     def crop(self):
         bbox = self.image.getbbox()
 
@@ -161,286 +344,337 @@ class Sprite:
         self.crop()
 
     def giveShade(self, coords):
-        if coords[0] < 0 or coords[1] < 0:
+        x, y = coords
+        indices = self.giveIndices()
+        if x < 0 or y < 0 or y >= indices.shape[0] or x >= indices.shape[1]:
             return None
 
-        try:
-            r, g, b, a = self.image.getpixel(coords)
-        except IndexError:
-            return None
+        return self.palette.indexColor(int(indices[y, x]))
 
-        if a == 0:
-            return None
 
-        arr = self.palette.arr()
-        red, green, blue = arr[:, :, 0], arr[:, :, 1], arr[:, :, 2]
-        truth_arr = (red == r) & (green == g) & (blue == b)
+class LazySprite(Sprite):
+    """Sprite whose image is only decoded on first access. loader is a callable without
+    arguments that returns the raw RGBA image, which is then processed as in Sprite.__init__."""
 
-        index = list(truth_arr.flatten()).index(True)
+    def __init__(self, loader, coords: tuple, palette: pal.Palette = pal.orct, dither: bool = True,
+                 transparent_color: tuple = (0, 0, 0)):
+        self._loader = loader
+        self._dither = dither
+        self._transparent_color = transparent_color
 
-        color = list(self.palette.color_dict.keys())[int(index/12)]
+        self._setState(None, coords, palette)
 
-        return (color, index % 12)
+    @property
+    def image(self):
+        if self._loader is not None:
+            self._decode()
+        return Sprite.image.fget(self)
 
+    @image.setter
+    def image(self, image):
+        Sprite.image.fset(self, image)
 
-def pasteOnMask(mask: Image.Image, pic_in: Image.Image):
-    mask_ar = np.array(mask)
-    pic_ar = np.array(pic_in)
-    pic_ar[:, :, 3] = mask_ar[:, :, 3]
-    return Image.fromarray(pic_ar)
+    @property
+    def image_base(self):
+        if self._loader is not None:
+            self._decode()
+        return Sprite.image_base.fget(self)
 
+    @image_base.setter
+    def image_base(self, image):
+        Sprite.image_base.fset(self, image)
 
-def mergeSprites(image1: Image.Image, image2: Image.Image, palette: pal.Palette = pal.orct):
-    im = Image.alpha_composite(image2, image1)
-    im = pal.addPalette(im, palette, dither=True)
-    return im
+    def isDecoded(self):
+        return self._loader is None
 
+    def _decode(self):
+        image = _prepareImage(self._loader(), self.palette,
+                              self._dither, self._transparent_color)
 
-def checkPrimaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor('1st Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
+        if self._image_base is None and self._indices_base is None:
+            self._image_base = image
+        if self._image is None and self._indices is None:
+            self._image = image
+        self._loader = None
 
-    return False
 
+def _prepareImage(image: Image.Image, palette: pal.Palette, dither: bool, transparent_color: tuple):
+    image = pal.addPalette(image, palette, dither, transparent_color)
 
-def checkSecondaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
+    bbox = image.getbbox()
+    return image.crop(bbox)
+
+
+def _indicesFromImage(image: Image.Image, palette: pal.Palette, strict: bool = False):
+    """Palette indices of an RGBA image with 255 for transparent pixels. If strict, returns None
+    when the image cannot be rebuilt from the indices."""
     data = np.array(image)
-    colors = palette.getColor('2nd Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
+    indices = palette.toIndices(data)
+    transparent = data[:, :, 3] == 0
 
-    return False
+    if strict:
+        visible = ~transparent
+        if (indices[visible] == 255).any() or (data[:, :, 3][visible] != 255).any():
+            return None
 
+    indices[transparent] = 255
 
-def checkTertiaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor('3rd Remap')
-    for color in colors:
-        if np.equal(color, data[:, :, :3]).all(axis=2).any():
-            return True
+    return indices
 
-    return False
 
+DECODED_CACHE_SIZE = 64
+_decoded_images = OrderedDict()
+_decoded_images_lock = Lock()
 
-def checkColor(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data = np.array(image)
-    colors = palette.getColor(color_name)
-    for shade in colors:
-        if np.equal(shade, data[:, :, :3]).all(axis=2).any():
-            return True
 
-    return False
+def _decodedImage(indices: np.ndarray, palette: pal.Palette):
+    """Gives the RGBA image of the indices of a compacted sprite, keeping the DECODED_CACHE_SIZE
+    most recently used ones."""
+    key = (id(indices), palette.name)
 
+    with _decoded_images_lock:
+        entry = _decoded_images.get(key)
+        # the entry holds the indices, so their id is not reused while it is cached
+        if entry is not None and entry[0] is indices:
+            _decoded_images.move_to_end(key)
+            return entry[1]
 
-def remapColor(image: Image.Image, color_name_old: str, color_name_new: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    image = _imageFromIndices(indices, palette)
 
-    color_old = palette.getColor(color_name_old)
-    color_new = palette.getColor(color_name_new)
+    with _decoded_images_lock:
+        _decoded_images[key] = (indices, image)
+        _decoded_images.move_to_end(key)
+        if len(_decoded_images) > DECODED_CACHE_SIZE:
+            _decoded_images.popitem(last=False)
 
-    # if color_new == 'NoColor':
-    #     return image
+    return image
 
-    for i in range(12):
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :][mask] = [r2, g2, b2, 255]
+def _imageFromIndices(indices: np.ndarray, palette: pal.Palette):
+    colors = np.zeros((256, 4), dtype=np.uint8)
+    flat = palette.flatColors()
+    colors[:len(flat), :3] = flat
+    colors[:len(flat), 3] = 255
 
-    return Image.fromarray(data_out)
+    return Image.fromarray(colors[indices], 'RGBA')
 
 
-def colorRemaps(image: Image.Image, first_remap: str, second_remap: str, third_remap: str, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+def pasteOnMask(mask: Image.Image, pic_in: Image.Image):
+    mask_ar = np.array(mask)
+    pic_ar = np.array(pic_in)
+    pic_ar[:, :, 3] = mask_ar[:, :, 3]
+    return Image.fromarray(pic_ar)
 
-    for color_names in [['1st Remap', first_remap], ['2nd Remap', second_remap], ['3rd Remap', third_remap]]:
-        if color_names[1] == 'NoColor':
-            continue
 
-        color_old = palette.getColor(color_names[0])
-        color_new = palette.getRemapColor(color_names[1])
+def mergeSprites(image1: Image.Image, image2: Image.Image, palette: pal.Palette = pal.orct):
+    im = Image.alpha_composite(image2, image1)
+    im = pal.addPalette(im, palette, dither=True)
+    return im
 
-        for i in range(12):
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
+# Color operations work on the palette indices of the image (see Palette.toIndices). Every
+# operation is a lookup table over the 256 indices, so the image is matched against the
+# palette only once instead of once per shade. When a color occurs in several of the
+# changed shades, the last one wins.
 
-    return Image.fromarray(data_out)
+def _colorLut(remaps: list):
+    """Builds a lookup table from a list of (palette indices, new colors) pairs. Returns the
+    new color and whether the color is changed for each index."""
+    lut = np.zeros((256, 3), dtype=np.uint8)
+    changed = np.zeros(256, dtype=bool)
 
+    for indices, colors in remaps:
+        for index, color in zip(indices, colors):
+            lut[index] = color
+            changed[index] = True
 
-def colorFirstRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    return lut, changed
 
-    if color_name == 'NoColor':
-        return image
 
-    color_old = palette.getColor('1st Remap')
-    color_new = palette.getRemapColor(color_name)
+def _applyColorLut(image: Image.Image, palette: pal.Palette, lut: np.ndarray, changed: np.ndarray,
+                   alpha: int = None):
+    data = np.array(image)
+    indices = palette.toIndices(data)
+    mask = changed[indices]
+
+    data[mask, :3] = lut[indices[mask]]
+    if alpha is not None:
+        data[mask, 3] = alpha
+
+    return Image.fromarray(data)
+
+
+def colorIndexLut(palette: pal.Palette, operations: list):
+    """Builds the lookup table over the palette indices (255 is transparent) of a list of
+    operations applied in order. An operation is one of ('remap', color, new color),
+    ('brightness', color, step) and ('remove', color, None), doing the same as remapColor,
+    changeBrightnessColor and removeColor."""
+    lut = np.arange(256, dtype=np.uint8)
+
+    for operation, color, value in operations:
+        step = np.arange(256, dtype=np.uint8)
+
+        if operation == 'remap':
+            indices = palette.colorIndices(color)
+            color_new = palette.getColor(value)
+            if indices is None or color_new is None:
+                continue
+            step[indices] = palette.toIndices(color_new)
+        elif operation == 'brightness':
+            indices = palette.colorIndices(color)
+            if indices is None:
+                continue
+            shades = np.clip(np.arange(12) + value, 0, 11)
+            step[indices] = palette.toIndices(palette.getColor(color)[shades])
+        elif operation == 'remove':
+            if color not in palette.color_dict:
+                continue
+            step[_colorSelection(palette, color)] = 255
+        else:
+            raise RuntimeError(f'Unknown color operation "{operation}".')
 
-    for i in range(12):
+        lut = step[lut]
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
+    return lut
 
-    return Image.fromarray(data_out)
 
+def _colorSelection(palette: pal.Palette, color: str or list):
+    """Gives for each palette index whether it belongs to one of the colors."""
+    if isinstance(color, str):
+        color = [color]
 
-def colorSecondRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+    selected = np.zeros(256, dtype=bool)
+    for color_name in color:
+        indices = palette.colorIndices(color_name)
+        if indices is not None:
+            selected[indices] = True
 
-    if color_name == 'NoColor':
-        return image
+    return selected
 
-    color_old = palette.getColor('2nd Remap')
-    color_new = palette.getRemapColor(color_name)
 
-    for i in range(12):
+def checkPrimaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
+    return checkColor(image, '1st Remap', palette)
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return Image.fromarray(data_out)
+def checkSecondaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
+    return checkColor(image, '2nd Remap', palette)
 
 
-def colorThirdRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+def checkTertiaryColor(image: Image.Image, palette: pal.Palette = pal.orct):
+    return checkColor(image, '3rd Remap', palette)
 
-    if color_name == 'NoColor':
+
+def checkColor(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    selected = _colorSelection(palette, color_name)
+
+    return bool(selected[palette.toIndices(np.array(image))].any())
+
+
+def remapColor(image: Image.Image, color_name_old: str, color_name_new: str,  palette: pal.Palette = pal.orct):
+    indices_old = palette.colorIndices(color_name_old)
+    color_new = palette.getColor(color_name_new)
+
+    if indices_old is None or color_new is None:
         return image
 
-    color_old = palette.getColor('3rd Remap')
-    color_new = palette.getRemapColor(color_name)
+    lut, changed = _colorLut([(indices_old, color_new)])
 
-    for i in range(12):
+    return _applyColorLut(image, palette, lut, changed, alpha=255)
 
-        r1, g1, b1 = color_old[i]  # Original value
-        r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return Image.fromarray(data_out)
+REMAP_CACHE_SIZE = 64
+_remap_luts = OrderedDict()
+# objects may be loaded and rendered from worker threads
+_remap_luts_lock = Lock()
 
 
-def colorAllInRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
+def _remapLut(palette: pal.Palette, first_remap: str, second_remap: str, third_remap: str):
+    """Gives the fused lookup table of all three remaps. The tables are memoized per palette
+    and remap colors, keeping the REMAP_CACHE_SIZE most recently used ones."""
+    key = (palette.name, first_remap, second_remap, third_remap)
 
-    if color_name == 'NoColor':
+    with _remap_luts_lock:
+        luts = _remap_luts.get(key)
+        if luts is not None:
+            _remap_luts.move_to_end(key)
+            return luts
+
+    remaps = []
+    for color_name_old, color_name_new in [['1st Remap', first_remap], ['2nd Remap', second_remap], ['3rd Remap', third_remap]]:
+        if color_name_new == 'NoColor':
+            continue
+
+        remaps.append((palette.colorIndices(color_name_old),
+                      palette.getRemapColor(color_name_new)))
+
+    luts = _colorLut(remaps)
+    for lut in luts:
+        lut.setflags(write=False)
+
+    with _remap_luts_lock:
+        _remap_luts[key] = luts
+        if len(_remap_luts) > REMAP_CACHE_SIZE:
+            _remap_luts.popitem(last=False)
+
+    return luts
+
+
+def colorRemaps(image: Image.Image, first_remap: str, second_remap: str, third_remap: str, palette: pal.Palette = pal.orct):
+    if first_remap == second_remap == third_remap == 'NoColor':
         return image
 
-    for color_old in pal.allColors():
+    lut, changed = _remapLut(palette, first_remap, second_remap, third_remap)
+
+    return _applyColorLut(image, palette, lut, changed)
 
-        color_old = palette.getColor(color_old)
-        color_new = palette.getRemapColor(color_name)
 
-        for i in range(12):
+def colorFirstRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    return colorRemaps(image, color_name, 'NoColor', 'NoColor', palette)
 
-            r1, g1, b1 = color_old[i]  # Original value
-            r2, g2, b2 = color_new[i]  # Value that we want to replace it with
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = (red == r1) & (green == g1) & (blue == b1)
-            data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return Image.fromarray(data_out)
+def colorSecondRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    return colorRemaps(image, 'NoColor', color_name, 'NoColor', palette)
 
 
-def _decrBr(data_in, color):
-    data_out = np.array(data_in)
+def colorThirdRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    return colorRemaps(image, 'NoColor', 'NoColor', color_name, palette)
 
-    for i in range(12):
-        j = i
-        if (i > 0):
-            j -= 1
-        r1, g1, b1 = color[i]  # Original value
-        r2, g2, b2 = color[j]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
 
-    return data_out
+def colorAllInRemap(image: Image.Image, color_name: str,  palette: pal.Palette = pal.orct):
+    if color_name == 'NoColor':
+        return image
 
+    color_new = palette.getRemapColor(color_name)
 
-def _incrBr(data_in, color):
-    data_out = np.array(data_in)
+    remaps = []
+    for color_name_old in pal.allColors():
+        indices = palette.colorIndices(color_name_old)
+        if indices is not None:
+            remaps.append((indices, color_new))
 
-    for i in range(12):
-        j = i
-        if (i < 11):
-            j += 1
-        r1, g1, b1 = color[i]  # Original value
-        r2, g2, b2 = color[j]  # Value that we want to replace it with
-        red, green, blue = data_in[:, :, 0], data_in[:, :, 1], data_in[:, :, 2]
-        mask = (red == r1) & (green == g1) & (blue == b1)
-        data_out[:, :, :3][mask] = [r2, g2, b2]
+    lut, changed = _colorLut(remaps)
 
-    return data_out
+    return _applyColorLut(image, palette, lut, changed)
 
 
 def changeBrightnessColor(image: Image.Image, value: int, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
     if isinstance(color, str):
         color = [color]
 
+    # shade i becomes shade i+value, clipped to the darkest and lightest shade
+    shades = np.clip(np.arange(12) + value, 0, 11)
+
+    remaps = []
     for color_name in color:
+        indices = palette.colorIndices(color_name)
+        if indices is None:
+            continue
 
-        color = palette.getColor(color_name)
+        remaps.append((indices, palette.getColor(color_name)[shades]))
 
-        if not isinstance(color, np.ndarray):
-            continue
+    lut, changed = _colorLut(remaps)
 
-        if (value < 0):
-            for step in range(-value):
-                for i in range(12):
-                    j = i
-                    if (i > 0):
-                        j -= 1
-                    r1, g1, b1 = color[i]  # Original value
-                    # Value that we want to replace it with
-                    r2, g2, b2 = color[j]
-                    red, green, blue = data_in[:, :,
-                                               0], data_in[:, :, 1], data_in[:, :, 2]
-                    mask = (red == r1) & (green == g1) & (blue == b1)
-                    data_out[:, :, :3][mask] = [r2, g2, b2]
-        else:
-            for step in range(value):
-                for i in range(12):
-                    j = i
-                    if (i < 11):
-                        j += 1
-                    r1, g1, b1 = color[i]  # Original value
-                    # Value that we want to replace it with
-                    r2, g2, b2 = color[j]
-                    red, green, blue = data_in[:, :,
-                                               0], data_in[:, :, 1], data_in[:, :, 2]
-                    mask = (red == r1) & (green == g1) & (blue == b1)
-                    data_out[:, :, :3][mask] = [r2, g2, b2]
-
-    return Image.fromarray(data_out)
+    return _applyColorLut(image, palette, lut, changed)
 
 
 def changeBrightness(image: Image.Image, step: int, palette: pal.Palette = pal.orct, include_sparkles=False):
@@ -458,49 +692,23 @@ def changeBrightness(image: Image.Image, step: int, palette: pal.Palette = pal.o
 
 
 def removeColor(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-    data_out = np.array(data_in)
-
-    mask = np.full(image.size, False).T
-
     if isinstance(color, str):
         color = [color]
 
-    for color_name in color:
-
-        if color_name not in palette.color_dict:
-            continue
-        color_arr = palette.getColor(color_name)
-
-        for shade in color_arr:
-            r1, g1, b1 = shade  # Original value
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = mask | ((red == r1) & (green == g1) & (blue == b1))
+    selected = _colorSelection(
+        palette, [color_name for color_name in color if color_name in palette.color_dict])
 
-    data_out[:, :, :][mask] = [0, 0, 0, 0]
+    data = np.array(image)
+    data[selected[palette.toIndices(data)]] = [0, 0, 0, 0]
 
-    return Image.fromarray(data_out)
+    return Image.fromarray(data)
 
 
 def protectColorMask(image: Image.Image, color: str or list, palette: pal.Palette = pal.orct):
-    data_in = np.array(image)
-
-    mask = np.full(image.size, True).T
-
     if isinstance(color, str):
         color = [color]
 
-    for color_name in color:
-
-        if color_name not in palette.color_dict:
-            continue
-        color_arr = palette.getColor(color_name)
-
-        for shade in color_arr:
-            r1, g1, b1 = shade  # Original value
-            red, green, blue = data_in[:, :,
-                                       0], data_in[:, :, 1], data_in[:, :, 2]
-            mask = mask & ~((red == r1) & (green == g1) & (blue == b1))
+    selected = _colorSelection(
+        palette, [color_name for color_name in color if color_name in palette.color_dict])
 
-    return Image.fromarray(~mask)
+    return Image.fromarray(selected[palette.toIndices(np.array(image))])